@@ -4,7 +4,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
 from importlib import import_module
 
-db = SQLAlchemy()
+from apps.replica import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 csrf = CSRFProtect()
 
@@ -54,10 +56,24 @@ def configure_database(app):
         db.session.remove()
 
 
+def register_background_jobs(app):
+    # Importing the analytics helpers also registers the Prediction rollup listener
+    from apps.analytics.util import rebuild_rollups_command
+    from apps.crop.util import dedupe_locations_command
+    from apps.data.prefetch import prefetch_command, start_prefetch_scheduler
+    from apps.data.retention import prune_observations_command
+    app.cli.add_command(dedupe_locations_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(prefetch_command)
+    app.cli.add_command(prune_observations_command)
+    start_prefetch_scheduler(app)
+
+
 def create_app(config):
     app = Flask(__name__)
     app.config.from_object(config)
     register_extensions(app)
     register_blueprints(app)
     configure_database(app)
+    register_background_jobs(app)
     return app
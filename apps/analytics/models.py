@@ -1 +1,50 @@
 # models.py for analytics module
+from apps import db
+
+
+class LocationCropCount(db.Model):
+    """Predictions per location and recommended crop, kept current on insert."""
+    __tablename__ = 'rollup_location_crop'
+
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), primary_key=True)
+    crop = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<LocationCropCount location={self.location_id} crop={self.crop} count={self.count}>"
+
+
+class DailyCropCount(db.Model):
+    """Predictions per UTC day and recommended crop, kept current on insert."""
+    __tablename__ = 'rollup_daily_crop'
+
+    day = db.Column(db.Date, primary_key=True)
+    crop = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DailyCropCount day={self.day} crop={self.crop} count={self.count}>"
+
+
+class UserCropCount(db.Model):
+    """Predictions per user and recommended crop; user_id 0 counts anonymous predictions."""
+    __tablename__ = 'rollup_user_crop'
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    crop = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<UserCropCount user={self.user_id} crop={self.crop} count={self.count}>"
+
+
+class OutcomeCount(db.Model):
+    """Predictions per suitability and confidence bucket (see apps.analytics.util.CONFIDENCE_BINS)."""
+    __tablename__ = 'rollup_prediction_outcome'
+
+    is_suitable = db.Column(db.Boolean, primary_key=True)
+    confidence_bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<OutcomeCount suitable={self.is_suitable} bucket={self.confidence_bucket} count={self.count}>"
@@ -1 +1,188 @@
 # util.py for analytics module
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, event, func, insert, select, update
+
+from apps import db
+from apps.analytics.models import LocationCropCount, DailyCropCount, UserCropCount, OutcomeCount
+from apps.data.write_behind import register_flush_hook
+from apps.model.models import Prediction
+
+logger = logging.getLogger(__name__)
+
+# user_id recorded in the per-user rollup for predictions made without a login
+ANONYMOUS_USER_ID = 0
+# Upper bounds of the confidence histogram buckets; run `flask rebuild-rollups` after changing them
+CONFIDENCE_BINS = (0.2, 0.4, 0.6, 0.8)
+CONFIDENCE_BIN_LABELS = ['0-20%', '21-40%', '41-60%', '61-80%', '81-100%']
+
+
+def confidence_bucket(score: float) -> int:
+    for index, bound in enumerate(CONFIDENCE_BINS):
+        if score <= bound:
+            return index
+    return len(CONFIDENCE_BINS)
+
+
+def _rollup_keys(row: Mapping) -> Tuple[Tuple, Tuple, Tuple]:
+    crop = row['crop_recommended']
+    timestamp = row.get('timestamp') or datetime.utcnow()
+    return (
+        (row['location_id'], crop),
+        (timestamp.date(), crop),
+        (row.get('user_id') or ANONYMOUS_USER_ID, crop),
+    )
+
+
+def _upsert_counts(connection, model, key_columns: Tuple[str, str], counts: Counter) -> None:
+    """Add counts to a rollup table with one dialect-native upsert per table."""
+    if not counts:
+        return
+    table = model.__table__
+    values = [dict(zip(key_columns, key), count=n) for key, n in counts.items()]
+    dialect = connection.dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table).values(values)
+        connection.execute(stmt.on_duplicate_key_update(count=table.c['count'] + stmt.inserted['count']))
+        return
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table).values(values)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_={'count': table.c['count'] + stmt.excluded['count']}
+        ))
+        return
+
+    # Other databases: update, then insert the keys that did not exist yet
+    for value in values:
+        result = connection.execute(
+            update(table)
+            .where(*[table.c[col] == value[col] for col in key_columns])
+            .values(count=table.c['count'] + value['count'])
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(value))
+
+
+def apply_prediction_rollups(connection, rows: Iterable[Mapping]) -> None:
+    """
+    Add prediction rows to the rollup tables on the given connection, so the
+    counts commit or roll back with the predictions themselves.
+
+    Rows are mappings with location_id, crop_recommended, user_id,
+    timestamp, is_suitable and confidence_score. ORM inserts are covered by the after_insert listener below
+    and write-behind bulk inserts by the flush hook; other code inserting
+    predictions with Core statements (which skip ORM events) must call this
+    itself in the same transaction.
+    """
+    by_location, by_day, by_user, by_outcome = Counter(), Counter(), Counter(), Counter()
+    for row in rows:
+        location_key, day_key, user_key = _rollup_keys(row)
+        by_location[location_key] += 1
+        by_day[day_key] += 1
+        by_user[user_key] += 1
+        by_outcome[(bool(row['is_suitable']), confidence_bucket(row['confidence_score']))] += 1
+    _upsert_counts(connection, LocationCropCount, ('location_id', 'crop'), by_location)
+    _upsert_counts(connection, DailyCropCount, ('day', 'crop'), by_day)
+    _upsert_counts(connection, UserCropCount, ('user_id', 'crop'), by_user)
+    _upsert_counts(connection, OutcomeCount, ('is_suitable', 'confidence_bucket'), by_outcome)
+
+
+@event.listens_for(Prediction, 'after_insert')
+def _prediction_inserted(mapper, connection, target) -> None:
+    apply_prediction_rollups(connection, [{
+        'location_id': target.location_id,
+        'crop_recommended': target.crop_recommended,
+        'user_id': target.user_id,
+        'timestamp': target.timestamp,
+        'is_suitable': target.is_suitable,
+        'confidence_score': target.confidence_score
+    }])
+
+
+register_flush_hook(Prediction, apply_prediction_rollups)
+
+
+def rebuild_prediction_rollups() -> None:
+    """Recompute every rollup from the predictions table (e.g. after merging locations)."""
+    count = func.count(Prediction.id)
+    day = func.date(Prediction.timestamp)
+    user_id = func.coalesce(Prediction.user_id, ANONYMOUS_USER_ID)
+    bucket = case(
+        *[(Prediction.confidence_score <= bound, i) for i, bound in enumerate(CONFIDENCE_BINS)],
+        else_=len(CONFIDENCE_BINS)
+    )
+    rebuilds = (
+        (LocationCropCount, ('location_id', 'crop', 'count'),
+         select(Prediction.location_id, Prediction.crop_recommended, count)
+         .group_by(Prediction.location_id, Prediction.crop_recommended)),
+        (DailyCropCount, ('day', 'crop', 'count'),
+         select(day, Prediction.crop_recommended, count)
+         .where(Prediction.timestamp.isnot(None))
+         .group_by(day, Prediction.crop_recommended)),
+        (UserCropCount, ('user_id', 'crop', 'count'),
+         select(user_id, Prediction.crop_recommended, count)
+         .group_by(user_id, Prediction.crop_recommended)),
+        (OutcomeCount, ('is_suitable', 'confidence_bucket', 'count'),
+         select(Prediction.is_suitable, bucket, count)
+         .group_by(Prediction.is_suitable, bucket)),
+    )
+    for model, columns, query in rebuilds:
+        db.session.execute(model.__table__.delete())
+        db.session.execute(insert(model.__table__).from_select(list(columns), query))
+    db.session.commit()
+
+
+def crop_totals() -> Dict[str, int]:
+    """Prediction count per recommended crop."""
+    rows = db.session.query(
+        LocationCropCount.crop, func.sum(LocationCropCount.count)
+    ).group_by(LocationCropCount.crop).all()
+    return {crop: int(total) for crop, total in rows}
+
+
+def location_crop_counts() -> List[LocationCropCount]:
+    return LocationCropCount.query.all()
+
+
+def daily_prediction_counts(days: int = 30) -> Dict[date, int]:
+    """Predictions per UTC day over the last `days` days."""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    rows = db.session.query(
+        DailyCropCount.day, func.sum(DailyCropCount.count)
+    ).filter(DailyCropCount.day >= since).group_by(DailyCropCount.day).order_by(DailyCropCount.day).all()
+    return {day: int(total) for day, total in rows}
+
+
+def outcome_counts() -> Dict[str, List[int]]:
+    """Prediction counts by suitability ([suitable, unsuitable]) and by confidence bucket."""
+    suitability = [0, 0]
+    confidence = [0] * len(CONFIDENCE_BIN_LABELS)
+    for row in OutcomeCount.query.all():
+        suitability[0 if row.is_suitable else 1] += row.count
+        confidence[row.confidence_bucket] += row.count
+    return {'suitability': suitability, 'confidence': confidence}
+
+
+def user_crop_counts(user_id: int) -> Dict[str, int]:
+    rows = UserCropCount.query.filter_by(user_id=user_id).all()
+    return {row.crop: row.count for row in rows}
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command() -> None:
+    """Recompute the prediction rollup tables from scratch."""
+    rebuild_prediction_rollups()
+    click.echo(f"Rebuilt rollups for {sum(crop_totals().values())} predictions")
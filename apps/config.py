@@ -18,11 +18,29 @@ class Config(object):
     try:
        
         # Construct mySQL connection string
-        SQLALCHEMY_DATABASE_URI = "mysql+pymysql://root:@127.0.0.1:3306/smartfarma_db"
+        SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', "mysql+pymysql://root:@127.0.0.1:3306/smartfarma_db")
     except Exception as e:
         print('> Error: DBMS Exception: ' + str(e))
         raise e 
 
+    # Connection pool for each engine (primary and replica)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        # Connections kept open per engine, plus temporary ones allowed under bursts
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '5')),
+        # Seconds to wait for a free connection before failing the request
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+        # Recycle connections before MySQL's wait_timeout drops them (seconds)
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '280')),
+        # Check a connection is alive before handing it out
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'True') == 'True',
+    }
+
+    # Read replica for dashboard and history queries (apps.replica); unset keeps every query on the primary.
+    # Binds do not inherit SQLALCHEMY_ENGINE_OPTIONS, so the pool settings are repeated here.
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = {'replica': {'url': DATABASE_REPLICA_URL, **SQLALCHEMY_ENGINE_OPTIONS}} if DATABASE_REPLICA_URL else {}
+
 
 class ProductionConfig(Config):
     DEBUG = False
@@ -7,6 +7,8 @@ class Location(db.Model):
     name = db.Column(db.String(100), nullable=False)
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
+    # Geohash of (latitude, longitude) for indexed proximity lookups
+    geohash = db.Column(db.String(12), nullable=True, index=True)
     description = db.Column(db.String(255), nullable=True)
 
     def __repr__(self):
@@ -1 +1,222 @@
 # util.py for crop module
+import os
+import math
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import or_, update
+
+from apps import db
+from apps.crop.models import Location
+
+logger = logging.getLogger(__name__)
+
+# Coordinates closer than this (meters) resolve to the same Location
+LOCATION_MATCH_RADIUS = float(os.getenv("LOCATION_MATCH_RADIUS", "100"))
+# Stored geohash length; 9 characters is a ~5 m cell
+GEOHASH_PRECISION = 9
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_EARTH_RADIUS_M = 6371000.0
+_METERS_PER_DEGREE = math.pi * _EARTH_RADIUS_M / 180
+
+
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        ch <<= 1
+        if value >= mid:
+            ch |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """(lat, lon) size in degrees of a geohash cell."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def geohash_neighbourhood(lat: float, lon: float, precision: int) -> List[str]:
+    """The cell containing the point and its eight neighbours."""
+    dlat, dlon = geohash_cell_size(precision)
+    cells = set()
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            cell_lat = max(-90.0, min(90.0, lat + i * dlat))
+            cell_lon = (lon + j * dlon + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(cell_lat, cell_lon, precision))
+    return sorted(cells)
+
+
+def search_precision(lat: float, radius_m: float) -> int:
+    """Longest geohash prefix whose cells are at least radius_m on each side at this latitude."""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        dlat, dlon = geohash_cell_size(precision)
+        width = dlon * _METERS_PER_DEGREE * math.cos(math.radians(lat))
+        if min(dlat * _METERS_PER_DEGREE, width) >= radius_m:
+            return precision
+    return 1
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * _EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def find_nearby_location(lat: float, lon: float,
+                         radius_m: float = LOCATION_MATCH_RADIUS) -> Optional[Location]:
+    """
+    Nearest stored Location within radius_m of the point, or None.
+
+    Candidates come from an indexed prefix scan over the 3x3 block of
+    geohash cells around the point, so no full table scan is needed.
+    """
+    prefixes = geohash_neighbourhood(lat, lon, search_precision(lat, radius_m))
+    candidates = Location.query.filter(
+        or_(*[Location.geohash.like(prefix + '%') for prefix in prefixes])
+    ).all()
+    best, best_distance = None, None
+    for candidate in candidates:
+        distance = haversine_m(lat, lon, candidate.latitude, candidate.longitude)
+        if distance <= radius_m and (best_distance is None or distance < best_distance):
+            best, best_distance = candidate, distance
+    return best
+
+
+def get_or_create_location(lat: float, lon: float, display_name: str,
+                           radius_m: float = LOCATION_MATCH_RADIUS) -> Location:
+    """
+    Return the Location within radius_m of these coordinates, creating it if needed.
+    Nothing in the schema makes locations unique, so two concurrent first
+    lookups near the same point can each insert one; `flask dedupe-locations`
+    merges such duplicates. Database errors are re-raised after a rollback.
+    """
+    location = find_nearby_location(lat, lon, radius_m)
+    if location:
+        return location
+
+    location = Location(
+        name=display_name,
+        latitude=lat,
+        longitude=lon,
+        geohash=geohash_encode(lat, lon),
+        description=f"Location for {display_name}"
+    )
+    try:
+        db.session.add(location)
+        db.session.commit()
+        logger.info(f"Created new location: {display_name}")
+    except Exception:
+        db.session.rollback()
+        raise
+    return location
+
+
+def backfill_geohashes() -> int:
+    """Set geohash on locations stored before the column existed."""
+    rows = Location.query.filter(
+        Location.geohash.is_(None), Location.latitude.isnot(None), Location.longitude.isnot(None)
+    ).all()
+    for location in rows:
+        location.geohash = geohash_encode(location.latitude, location.longitude)
+    db.session.commit()
+    return len(rows)
+
+
+def _location_references():
+    # Tables with a locations.id foreign key; imported here to avoid import cycles
+    from apps.data.models import SoilData, WeatherData
+    from apps.model.models import Prediction
+    return (Prediction, SoilData, WeatherData)
+
+
+def _location_summaries():
+    # Tables derived per location; rebuilt after a merge rather than repointed
+    from apps.analytics.models import LocationCropCount
+    from apps.data.models import LatestSoil, LatestWeather
+    return (LocationCropCount, LatestSoil, LatestWeather)
+
+
+def merge_locations(keep_id: int, duplicate_ids: List[int]) -> None:
+    """
+    Repoint rows referencing the duplicates at keep_id and delete the duplicates.
+    Per-location summaries of the duplicates are dropped; rebuild them afterwards.
+    """
+    for model in _location_references():
+        db.session.execute(
+            update(model).where(model.location_id.in_(duplicate_ids)).values(location_id=keep_id)
+        )
+    for model in _location_summaries():
+        db.session.execute(model.__table__.delete().where(model.location_id.in_(duplicate_ids)))
+    Location.query.filter(Location.id.in_(duplicate_ids)).delete(synchronize_session=False)
+
+
+def find_duplicate_locations(radius_m: float = LOCATION_MATCH_RADIUS) -> Dict[int, List[int]]:
+    """
+    Group locations within radius_m of an earlier location.
+    Returns {kept location id: [duplicate ids]}; the oldest (lowest id) is kept.
+    """
+    kept: Dict[str, List[Location]] = {}
+    groups: Dict[int, List[int]] = {}
+    locations = Location.query.filter(
+        Location.latitude.isnot(None), Location.longitude.isnot(None)
+    ).order_by(Location.id).all()
+    # One grid for the whole pass, fine enough for the highest latitude present
+    precision = min((search_precision(l.latitude, radius_m) for l in locations), default=1)
+    for location in locations:
+        match = None
+        for cell in geohash_neighbourhood(location.latitude, location.longitude, precision):
+            for other in kept.get(cell, []):
+                if haversine_m(location.latitude, location.longitude, other.latitude, other.longitude) <= radius_m:
+                    match = other
+                    break
+            if match:
+                break
+        if match:
+            groups.setdefault(match.id, []).append(location.id)
+        else:
+            cell = geohash_encode(location.latitude, location.longitude, precision)
+            kept.setdefault(cell, []).append(location)
+    return groups
+
+
+@click.command('dedupe-locations')
+@click.option('--radius', default=LOCATION_MATCH_RADIUS, show_default=True,
+              help='Merge locations closer than this many meters.')
+@click.option('--dry-run', is_flag=True, help='Report duplicates without merging them.')
+@with_appcontext
+def dedupe_locations_command(radius: float, dry_run: bool) -> None:
+    """Backfill geohashes and merge near-duplicate locations."""
+    click.echo(f"Backfilled geohash for {backfill_geohashes()} locations")
+    groups = find_duplicate_locations(radius)
+    for keep_id, duplicate_ids in groups.items():
+        click.echo(f"Location {keep_id} <- {duplicate_ids}")
+        if not dry_run:
+            merge_locations(keep_id, duplicate_ids)
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+        if groups:
+            from apps.analytics.util import rebuild_prediction_rollups
+            from apps.data.latest import rebuild_latest_observations
+            rebuild_prediction_rollups()
+            rebuild_latest_observations()
+    merged = sum(len(ids) for ids in groups.values())
+    click.echo(f"{'Found' if dry_run else 'Merged'} {merged} duplicate locations")
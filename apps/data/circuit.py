@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Consecutive upstream failures that open a circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+# Seconds an open circuit waits before letting a single probe through
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+def is_upstream_failure(exc: Exception) -> bool:
+    """
+    Connection problems, timeouts, 5xx and 429 mean the upstream is unhealthy;
+    other 4xx answers (e.g. an unknown city) mean it is up and working.
+    """
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(exc, requests.exceptions.RequestException)
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after failure_threshold consecutive upstream failures.
+    Open -> half-open after reset_timeout; exactly one probe call is let
+    through, and its outcome closes the circuit or re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+                 is_failure: Callable[[Exception], bool] = is_upstream_failure):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _before_call(self) -> None:
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                logger.info(f"Circuit {self.name} half-open, probing upstream")
+                return
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def _on_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self.state = CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def _on_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(f"Circuit {self.name} opened after {self.failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def call(self, fn: Callable, *args, **kwargs):
+        self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure(e):
+                self._on_failure()
+            else:
+                self._on_success()
+            raise
+        self._on_success()
+        return result
+
+    def status(self) -> Dict:
+        return {'state': self.state, 'failures': self.failures}
+
+
+breakers: Dict[str, CircuitBreaker] = {
+    'isda': CircuitBreaker('isda'),
+    'weatherapi': CircuitBreaker('weatherapi'),
+    'grok': CircuitBreaker('grok'),
+}
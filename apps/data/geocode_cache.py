@@ -0,0 +1,102 @@
+import os
+import re
+import logging
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from flask import has_app_context
+
+from apps import db
+from apps.data.cache import TTLCache, MISSING
+from apps.data.models import GeocodeCache
+
+logger = logging.getLogger(__name__)
+
+# Positive results are kept for this long (seconds)
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+# "No result" answers are retried after this long (seconds)
+GEOCODE_NEGATIVE_TTL = int(os.getenv("GEOCODE_NEGATIVE_TTL", str(24 * 3600)))
+# Size of the per-process LRU in front of the database
+GEOCODE_LRU_SIZE = int(os.getenv("GEOCODE_LRU_SIZE", "1024"))
+
+# Trailing country names dropped from the cache key ("Nakuru, Kenya" == "nakuru")
+COUNTRY_SUFFIXES = ('republic of kenya', 'kenya', 'ke')
+
+_lru = TTLCache(maxsize=GEOCODE_LRU_SIZE, ttl=GEOCODE_CACHE_TTL)
+
+
+def normalize_address(address: str) -> str:
+    """
+    Cache key for an address: case, accents, punctuation and whitespace
+    folded, and a trailing country name removed.
+    """
+    key = unicodedata.normalize('NFKD', address).encode('ascii', 'ignore').decode('ascii')
+    key = re.sub(r'[^\w\s]', ' ', key.lower())
+    key = ' '.join(key.split())
+    for suffix in COUNTRY_SUFFIXES:
+        if key.endswith(' ' + suffix):
+            key = key[:-len(suffix) - 1]
+            break
+    return key[:255]
+
+
+def _from_row(row: GeocodeCache) -> Optional[Dict[str, Any]]:
+    if not row.found:
+        return None
+    return {'lat': row.latitude, 'lon': row.longitude, 'display_name': row.display_name}
+
+
+def get_cached_geocode(address: str) -> Any:
+    """
+    Cached geocode for an address: a result dict, None for a cached
+    "no result", or MISSING when the address has to be looked up.
+    """
+    key = normalize_address(address)
+    cached = _lru.get(key)
+    if cached is not MISSING:
+        return dict(cached) if cached else None
+
+    if not has_app_context():
+        return MISSING
+    try:
+        row = db.session.get(GeocodeCache, key)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Geocode cache lookup failed: {str(e)}")
+        return MISSING
+    if not row:
+        return MISSING
+
+    ttl = GEOCODE_CACHE_TTL if row.found else GEOCODE_NEGATIVE_TTL
+    age = (datetime.utcnow() - row.created_at).total_seconds()
+    if age >= ttl:
+        return MISSING
+
+    result = _from_row(row)
+    _lru.set(key, result, ttl=ttl - age)
+    return dict(result) if result else None
+
+
+def store_geocode(address: str, result: Optional[Dict[str, Any]]) -> None:
+    """Cache a geocoding answer; pass None to cache "no result"."""
+    key = normalize_address(address)
+    cached = {k: result[k] for k in ('lat', 'lon', 'display_name')} if result else None
+    _lru.set(key, cached, ttl=GEOCODE_CACHE_TTL if result else GEOCODE_NEGATIVE_TTL)
+
+    if not has_app_context():
+        return
+    try:
+        db.session.merge(GeocodeCache(
+            query_key=key,
+            address=address[:255],
+            found=result is not None,
+            latitude=result['lat'] if result else None,
+            longitude=result['lon'] if result else None,
+            display_name=result.get('display_name', '')[:500] if result else None,
+            created_at=datetime.utcnow()
+        ))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Geocode cache store failed: {str(e)}")
@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Per-upstream connection pool, timeout and retry settings.
+# timeout is (connect, read) seconds; retries only cover failed connects,
+# since the callers already retry whole requests where that is safe.
+UPSTREAMS: Dict[str, Dict] = {
+    'nominatim': {
+        'pool_maxsize': int(os.getenv("NOMINATIM_POOL_SIZE", "2")),
+        'timeout': (5, 15),
+        'retries': 1,
+    },
+    'weatherapi': {
+        'pool_maxsize': int(os.getenv("WEATHERAPI_POOL_SIZE", "10")),
+        'timeout': (5, 10),
+        'retries': 2,
+    },
+    'isda': {
+        'pool_maxsize': int(os.getenv("ISDA_POOL_SIZE", "10")),
+        'timeout': (5, 15),
+        'retries': 2,
+    },
+    'grok': {
+        'pool_maxsize': int(os.getenv("GROK_POOL_SIZE", "4")),
+        'timeout': (5, 20),
+        'retries': 1,
+    },
+}
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+# Outbound requests per upstream made inside count_upstream_calls() on this thread
+_upstream_calls: ContextVar[Optional[Counter]] = ContextVar('upstream_calls', default=None)
+
+
+def _build_session(settings: Dict) -> requests.Session:
+    session = requests.Session()
+    retry = Retry(
+        total=settings['retries'],
+        connect=settings['retries'],
+        read=0,
+        status=0,
+        backoff_factor=0.2,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings['pool_maxsize'], max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(upstream: str) -> requests.Session:
+    """
+    Shared keep-alive session for an upstream, so repeated calls reuse
+    pooled TCP/TLS connections instead of handshaking every time.
+    Callers fetch the session once per request they send, which is what
+    count_upstream_calls() counts.
+    """
+    calls = _upstream_calls.get()
+    if calls is not None:
+        calls[upstream] += 1
+    session = _sessions.get(upstream)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(upstream)
+            if session is None:
+                session = _build_session(UPSTREAMS[upstream])
+                _sessions[upstream] = session
+    return session
+
+
+def upstream_timeout(upstream: str) -> Tuple[float, float]:
+    return UPSTREAMS[upstream]['timeout']
+
+
+@contextmanager
+def count_upstream_calls() -> Iterator[Counter]:
+    """
+    Count outbound requests per upstream made by this thread inside the block.
+    Cache hits and lookups coalesced onto another thread's call count nothing.
+    """
+    calls = Counter()
+    token = _upstream_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _upstream_calls.reset(token)
@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from apps import db
+from apps.data.models import InsightCache
+from apps.data.util import request_grok_crop_recommendation, get_grok_crop_recommendation, GROK_API_KEY
+
+logger = logging.getLogger(__name__)
+
+# Cached insights older than this are regenerated
+INSIGHT_CACHE_TTL = int(os.getenv("INSIGHT_CACHE_TTL", str(7 * 24 * 3600)))
+# Least recently used entries beyond this count are evicted
+INSIGHT_CACHE_MAX_ENTRIES = int(os.getenv("INSIGHT_CACHE_MAX_ENTRIES", "5000"))
+
+# Bin width per input; values inside the same bin share one cached insight
+INSIGHT_CACHE_BINS = {
+    'n': 5.0,
+    'p': 5.0,
+    'k': 5.0,
+    'ph': 0.2,
+    'temperature': 1.0,
+    'humidity': 5.0,
+    'rainfall': 2.0,
+}
+
+
+def _bin(value, width: float) -> Optional[int]:
+    if value is None:
+        return None
+    return int(float(value) // width)
+
+
+def insight_cache_key(soil_data: Dict, weather_data: Dict, crop: str, location_key) -> str:
+    """
+    Content address for an insight: crop, location and binned soil/weather inputs.
+    """
+    values = {**soil_data, **weather_data}
+    key = {
+        'crop': str(crop or '').strip().lower(),
+        'location': ' '.join(str(location_key or '').lower().split()),
+        'bins': {name: _bin(values.get(name), width) for name, width in INSIGHT_CACHE_BINS.items()},
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_cached_insight(cache_key: str) -> Optional[str]:
+    entry = db.session.get(InsightCache, cache_key)
+    if not entry:
+        return None
+    now = datetime.utcnow()
+    if entry.created_at < now - timedelta(seconds=INSIGHT_CACHE_TTL):
+        db.session.delete(entry)
+        db.session.commit()
+        return None
+    entry.last_accessed = now
+    db.session.commit()
+    return entry.insights
+
+
+def store_insight(cache_key: str, insights: str, crop: str, location_name: str) -> None:
+    now = datetime.utcnow()
+    db.session.merge(InsightCache(
+        cache_key=cache_key,
+        crop=crop,
+        location_name=location_name,
+        insights=insights,
+        created_at=now,
+        last_accessed=now
+    ))
+    db.session.commit()
+
+    overflow = InsightCache.query.count() - INSIGHT_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale_keys = [row.cache_key for row in db.session.query(InsightCache.cache_key)
+                      .order_by(InsightCache.last_accessed.asc()).limit(overflow)]
+        InsightCache.query.filter(InsightCache.cache_key.in_(stale_keys)).delete(synchronize_session=False)
+        db.session.commit()
+        logger.info(f"Evicted {len(stale_keys)} least recently used insight cache entries")
+
+
+def get_crop_insights(soil_data: Dict, weather_data: Dict, crop: str, location_name: str, location_id=None) -> str:
+    """
+    Grok crop insights served from the insight cache when possible.
+
+    Only successful Grok responses are cached; errors are returned as the
+    same user-facing strings get_grok_crop_recommendation produces.
+    """
+    if not GROK_API_KEY:
+        return get_grok_crop_recommendation(soil_data, weather_data, crop, location_name)
+
+    cache_key = insight_cache_key(soil_data, weather_data, crop, location_id or location_name)
+    try:
+        cached = get_cached_insight(cache_key)
+        if cached:
+            logger.info(f"Insight cache hit for {crop} at {location_name}")
+            return cached
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Insight cache lookup failed: {str(e)}")
+
+    try:
+        insights = request_grok_crop_recommendation(soil_data, weather_data, crop, location_name)
+    except Exception as e:
+        return f"Error contacting Grok API: {str(e)}"
+
+    try:
+        store_insight(cache_key, insights, crop, location_name)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Insight cache store failed: {str(e)}")
+    return insights
@@ -0,0 +1,143 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from flask import current_app
+from sqlalchemy import insert, select, update
+
+from apps import db
+from apps.data.insight_cache import get_crop_insights
+from apps.data.models import InsightJob
+
+logger = logging.getLogger(__name__)
+
+# Background pool for Grok insight generation, so /data/predict never waits on the LLM
+INSIGHT_WORKERS = int(os.getenv("INSIGHT_WORKERS", "4"))
+# Finished jobs are kept this many seconds for polling clients
+INSIGHT_JOB_TTL = int(os.getenv("INSIGHT_JOB_TTL", "900"))
+# A job still pending after this many seconds is reported as failed (its worker process died)
+INSIGHT_JOB_TIMEOUT = int(os.getenv("INSIGHT_JOB_TIMEOUT", "180"))
+# How often a waiter re-reads a job owned by another worker process (seconds)
+INSIGHT_POLL_INTERVAL = float(os.getenv("INSIGHT_POLL_INTERVAL", "1.0"))
+# Expired jobs are deleted by the background workers at most this often (seconds)
+INSIGHT_PRUNE_INTERVAL = float(os.getenv("INSIGHT_PRUNE_INTERVAL", "60"))
+
+_executor = ThreadPoolExecutor(max_workers=INSIGHT_WORKERS, thread_name_prefix="grok-insights")
+# Jobs running in this process, so local waiters wake as soon as they finish.
+# Job state itself lives in the insight_jobs table: gunicorn runs several
+# worker processes and a poll may land on a different one from the POST.
+_local_events: Dict[str, threading.Event] = {}
+_local_lock = threading.Lock()
+_last_prune = 0.0
+
+_jobs = InsightJob.__table__
+
+
+def _prune_jobs() -> None:
+    """Delete expired jobs, at most once per INSIGHT_PRUNE_INTERVAL in this process."""
+    global _last_prune
+    with _local_lock:
+        if time.monotonic() - _last_prune < INSIGHT_PRUNE_INTERVAL:
+            return
+        _last_prune = time.monotonic()
+    cutoff = datetime.utcnow() - timedelta(seconds=INSIGHT_JOB_TTL)
+    with db.engine.begin() as connection:
+        connection.execute(_jobs.delete().where(_jobs.c.created_at < cutoff))
+
+
+def _finish_job(job_id: str, status: str, result: str) -> None:
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(_jobs).where(_jobs.c.job_id == job_id)
+            .values(status=status, result=result, finished_at=datetime.utcnow())
+        )
+
+
+def _run_job(app, job_id: str, soil_data: Dict, weather_data: Dict, crop: str,
+             location_name: str, location_id) -> None:
+    try:
+        # The insight cache and job table live in the database, so the worker needs an app context
+        with app.app_context():
+            try:
+                result = get_crop_insights(
+                    soil_data=soil_data,
+                    weather_data=weather_data,
+                    crop=crop,
+                    location_name=location_name,
+                    location_id=location_id
+                )
+                _finish_job(job_id, "done", result)
+            except Exception as e:
+                logger.error(f"Grok insight job {job_id} failed: {str(e)}")
+                _finish_job(job_id, "error", "Failed to fetch actionable insights from Grok API.")
+    except Exception as e:
+        logger.error(f"Could not record the result of insight job {job_id}: {str(e)}")
+    finally:
+        with _local_lock:
+            event = _local_events.pop(job_id, None)
+        if event:
+            event.set()
+    # Housekeeping runs here rather than in submit_insight_job, off the request path
+    try:
+        with app.app_context():
+            _prune_jobs()
+    except Exception as e:
+        logger.warning(f"Could not prune expired insight jobs: {str(e)}")
+
+
+def submit_insight_job(soil_data: Dict, weather_data: Dict, crop: str, location_name: str, location_id=None) -> str:
+    """
+    Record a pending Grok insight job, queue it on the background pool and return its id.
+    """
+    job_id = uuid.uuid4().hex
+    with db.engine.begin() as connection:
+        connection.execute(insert(_jobs).values(
+            job_id=job_id, status="pending", crop=crop, created_at=datetime.utcnow()
+        ))
+    with _local_lock:
+        _local_events[job_id] = threading.Event()
+    _executor.submit(_run_job, current_app._get_current_object(), job_id,
+                     soil_data, weather_data, crop, location_name, location_id)
+    return job_id
+
+
+def get_insight_job(job_id: str) -> Optional[Dict]:
+    """Return a JSON-safe snapshot of a job, or None if it is unknown or expired."""
+    with db.engine.connect() as connection:
+        job = connection.execute(select(_jobs).where(_jobs.c.job_id == job_id)).mappings().first()
+    if not job or job["created_at"] < datetime.utcnow() - timedelta(seconds=INSIGHT_JOB_TTL):
+        return None
+    status, result = job["status"], job["result"]
+    if status == "pending" and job["created_at"] < datetime.utcnow() - timedelta(seconds=INSIGHT_JOB_TIMEOUT):
+        status, result = "error", "Failed to fetch actionable insights from Grok API."
+    return {
+        "job_id": job_id,
+        "status": status,
+        "crop": job["crop"],
+        "grok_recommendation": result,
+    }
+
+
+def wait_for_insight_job(job_id: str, timeout: float) -> Optional[Dict]:
+    """
+    Block up to timeout seconds for a job to finish, then return its snapshot.
+    Jobs running in this process wake the waiter directly; others are re-read
+    every INSIGHT_POLL_INTERVAL seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = get_insight_job(job_id)
+        remaining = deadline - time.monotonic()
+        if not job or job["status"] != "pending" or remaining <= 0:
+            return job
+        with _local_lock:
+            event = _local_events.get(job_id)
+        if event:
+            event.wait(remaining)
+        else:
+            time.sleep(min(INSIGHT_POLL_INTERVAL, remaining))
@@ -1,85 +1,163 @@
-import time
-import requests
-import os
-from dotenv import load_dotenv
-from typing import Optional, Dict
-
-load_dotenv()
-
-ISDA_API_USERNAME = os.getenv("ISDA_API_USERNAME")
-ISDA_API_PASSWORD = os.getenv("ISDA_API_PASSWORD")
-
-class ISDAClient:
-    def __init__(self, base_url: str = "https://api.isda-africa.com"):
-        self.base_url = base_url
-        self.username = ISDA_API_USERNAME
-        self.password = ISDA_API_PASSWORD
-        self.token: Optional[str] = None
-        self.token_expiry: float = 0  # epoch time
-
-    def _authenticate(self) -> None:
-        url = f"{self.base_url}/login"
-        data = {
-            "grant_type": "password",
-            "username": self.username,
-            "password": self.password,
-        }
-        headers = {
-            "accept": "application/json",
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        response = requests.post(url, data=data, headers=headers, timeout=10)
-        response.raise_for_status()
-        payload = response.json()
-        self.token = payload.get("access_token")
-        self.token_expiry = time.time() + 3600  # token valid for 1 hour
-
-    def _get_token(self) -> str:
-        if not self.token or time.time() >= self.token_expiry:
-            self._authenticate()
-        return self.token
-
-    def fetch_soil_data(self, lat: float, lon: float, retries: int = 3, delay: int = 2) -> Dict[str, float]:
-        """
-        Fetch soil data with retry logic. Falls back to defaults if all attempts fail.
-        """
-        url = f"{self.base_url}/isdasoil/v2/soilproperty"
-        params = {
-            "lon": lon,
-            "lat": lat,
-            "depth": "0-20",
-            "property": "nitrogen_total,phosphorous_extractable,potassium_extractable,ph"
-        }
-
-        for attempt in range(1, retries + 1):
-            try:
-                headers = {
-                    "Authorization": f"Bearer {self._get_token()}",
-                    "accept": "application/json"
-                }
-                response = requests.get(url, params=params, headers=headers, timeout=15)
-                response.raise_for_status()
-                data = response.json()
-                props = data.get("properties", {})
-
-                if not props:
-                    print(f"Attempt {attempt}: Empty properties for lat={lat}, lon={lon}")
-                    continue
-
-                soil = {
-                    "N": float(props.get("nitrogen_total", 100.0)),
-                    "P": float(props.get("phosphorous_extractable", 30.0)),
-                    "K": float(props.get("potassium_extractable", 300.0)),
-                    "ph": float(props.get("ph", 6.5))
-                }
-                print(f"Fetched soil data (attempt {attempt}): {soil}")
-                return soil
-
-            except requests.exceptions.RequestException as e:
-                print(f"API error (attempt {attempt}/{retries}): {str(e)}")
-                if attempt < retries:
-                    print(f"Retrying in {delay} seconds...")
-                    time.sleep(delay)
-
-        print("Failed after retries, using fallback soil data")
-        return {"N": 100.0, "P": 30.0, "K": 300.0, "ph": 6.5}
\ No newline at end of file
+import time
+import threading
+import logging
+import requests
+import os
+from dotenv import load_dotenv
+from typing import Optional, Dict
+
+from apps.data.http_client import get_session, upstream_timeout
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ISDA_API_USERNAME = os.getenv("ISDA_API_USERNAME")
+ISDA_API_PASSWORD = os.getenv("ISDA_API_PASSWORD")
+
+# Lifetime assumed when the login response has no expires_in
+ISDA_TOKEN_LIFETIME = int(os.getenv("ISDA_TOKEN_LIFETIME", "3600"))
+# Refresh this many seconds before the token expires
+ISDA_TOKEN_REFRESH_MARGIN = int(os.getenv("ISDA_TOKEN_REFRESH_MARGIN", "300"))
+
+
+class ISDAClient:
+    """
+    iSDAsoil API client with a shared, thread-safe access token.
+
+    Only one thread logs in at a time. Once the token enters the refresh
+    margin, a single caller refreshes it while the others keep using the
+    still-valid token; when it has actually expired, callers wait for the
+    refreshing thread instead of logging in themselves.
+    """
+
+    def __init__(self, base_url: str = "https://api.isda-africa.com",
+                 refresh_margin: int = ISDA_TOKEN_REFRESH_MARGIN):
+        self.base_url = base_url
+        self.username = ISDA_API_USERNAME
+        self.password = ISDA_API_PASSWORD
+        self.refresh_margin = refresh_margin
+        self.token: Optional[str] = None
+        self.token_expiry: float = 0  # epoch time
+        self._lock = threading.Lock()
+
+    def _authenticate(self) -> None:
+        url = f"{self.base_url}/login"
+        data = {
+            "grant_type": "password",
+            "username": self.username,
+            "password": self.password,
+            "scope": "",
+            "client_id": "string",
+            "client_secret": "string"
+        }
+        headers = {
+            "accept": "application/json",
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+        response = get_session('isda').post(url, data=data, headers=headers, timeout=(upstream_timeout('isda')[0], 10))
+        response.raise_for_status()
+        payload = response.json()
+        token = payload.get("access_token")
+        if not token:
+            raise ValueError("No access_token in iSDAsoil login response")
+        self.token = token
+        self.token_expiry = time.time() + float(payload.get("expires_in") or ISDA_TOKEN_LIFETIME)
+        logger.info("✅ Obtained iSDAsoil API token")
+
+    def _needs_refresh(self) -> bool:
+        return not self.token or time.time() >= self.token_expiry - self.refresh_margin
+
+    def _is_expired(self) -> bool:
+        return not self.token or time.time() >= self.token_expiry
+
+    def get_token(self) -> str:
+        if not self._needs_refresh():
+            return self.token
+
+        if not self._is_expired():
+            # Still valid: let one caller refresh early, everyone else keeps the current token
+            if self._lock.acquire(blocking=False):
+                try:
+                    if self._needs_refresh():
+                        self._authenticate()
+                except Exception as e:
+                    logger.warning(f"Early iSDAsoil token refresh failed, keeping current token: {str(e)}")
+                finally:
+                    self._lock.release()
+            return self.token
+
+        with self._lock:
+            # Another thread may have refreshed while we waited
+            if self._is_expired():
+                self._authenticate()
+            return self.token
+
+    # Kept for callers of the original private name
+    _get_token = get_token
+
+    def invalidate(self, token: str) -> None:
+        """Drop a token the API rejected, unless another thread already replaced it."""
+        with self._lock:
+            if self.token == token:
+                self.token = None
+                self.token_expiry = 0
+
+    def fetch_soil_data(self, lat: float, lon: float, retries: int = 3, delay: int = 2) -> Dict[str, float]:
+        """
+        Fetch soil data with retry logic. Falls back to defaults if all attempts fail.
+        """
+        url = f"{self.base_url}/isdasoil/v2/soilproperty"
+        params = {
+            "lon": lon,
+            "lat": lat,
+            "depth": "0-20",
+            "property": "nitrogen_total,phosphorous_extractable,potassium_extractable,ph"
+        }
+
+        for attempt in range(1, retries + 1):
+            try:
+                headers = {
+                    "Authorization": f"Bearer {self._get_token()}",
+                    "accept": "application/json"
+                }
+                response = get_session('isda').get(url, params=params, headers=headers, timeout=upstream_timeout('isda'))
+                response.raise_for_status()
+                data = response.json()
+                props = data.get("properties", {})
+
+                if not props:
+                    print(f"Attempt {attempt}: Empty properties for lat={lat}, lon={lon}")
+                    continue
+
+                soil = {
+                    "N": float(props.get("nitrogen_total", 100.0)),
+                    "P": float(props.get("phosphorous_extractable", 30.0)),
+                    "K": float(props.get("potassium_extractable", 300.0)),
+                    "ph": float(props.get("ph", 6.5))
+                }
+                print(f"Fetched soil data (attempt {attempt}): {soil}")
+                return soil
+
+            except requests.exceptions.RequestException as e:
+                print(f"API error (attempt {attempt}/{retries}): {str(e)}")
+                if attempt < retries:
+                    print(f"Retrying in {delay} seconds...")
+                    time.sleep(delay)
+
+        print("Failed after retries, using fallback soil data")
+        return {"N": 100.0, "P": 30.0, "K": 300.0, "ph": 6.5}
+
+
+_client: Optional[ISDAClient] = None
+_client_lock = threading.Lock()
+
+
+def get_isda_client() -> ISDAClient:
+    """Process-wide ISDAClient, so every gunicorn thread shares one token."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ISDAClient()
+    return _client
@@ -0,0 +1,177 @@
+import os
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.orm import aliased
+
+from apps import db
+from apps.data.cache import MISSING, TTLCache
+from apps.data.models import SoilData, WeatherData, LatestSoil, LatestWeather
+from apps.data import write_behind
+from apps.data.write_behind import WRITE_BEHIND_ENABLED, WRITE_BEHIND_INTERVAL, register_flush_hook
+
+logger = logging.getLogger(__name__)
+
+# Skip history rows whose values match the location's latest observation
+SKIP_UNCHANGED_OBSERVATIONS = os.getenv("SKIP_UNCHANGED_OBSERVATIONS", "True") == "True"
+# Values queued per location are remembered this many seconds, long enough to outlive a flush
+PENDING_OBSERVATION_TTL = float(os.getenv("PENDING_OBSERVATION_TTL", str(max(5.0, 5 * WRITE_BEHIND_INTERVAL))))
+
+# history model -> (latest model, value columns copied across)
+LATEST_TABLES: Dict[type, Tuple[type, Tuple[str, ...]]] = {
+    SoilData: (LatestSoil, ('nitrogen', 'phosphorus', 'potassium', 'ph')),
+    WeatherData: (LatestWeather, ('temperature', 'humidity', 'rainfall')),
+}
+
+# (history model, location_id) -> values of the row this process last queued.
+# Queued rows reach the latest tables only when the write-behind buffer
+# flushes, so repeats arriving before then are compared against these.
+_pending = TTLCache(maxsize=4096, ttl=PENDING_OBSERVATION_TTL)
+
+
+def _newest_per_location(rows: Iterable[Mapping], columns: Tuple[str, ...]) -> Dict[int, Dict]:
+    # Several readings for one location in a batch: keep the newest (the later one on a tie)
+    newest: Dict[int, Dict] = {}
+    for row in rows:
+        value = {col: row[col] for col in columns}
+        value['location_id'] = row['location_id']
+        value['date_recorded'] = row.get('date_recorded') or datetime.utcnow()
+        current = newest.get(value['location_id'])
+        if current is None or value['date_recorded'] >= current['date_recorded']:
+            newest[value['location_id']] = value
+    return newest
+
+
+def _upsert_latest(connection, model, columns: Tuple[str, ...], values: Iterable[Dict]) -> None:
+    """Insert or replace per-location rows, never letting an older reading overwrite a newer one."""
+    values = list(values)
+    if not values:
+        return
+    table = model.__table__
+    dialect = connection.dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table).values(values)
+        newer = stmt.inserted['date_recorded'] >= table.c['date_recorded']
+        # MySQL applies assignments left to right, so date_recorded must come last
+        assignments = [(col, func.if_(newer, stmt.inserted[col], table.c[col]))
+                       for col in columns + ('date_recorded',)]
+        connection.execute(stmt.on_duplicate_key_update(assignments))
+        return
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table).values(values)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['location_id'],
+            set_={col: stmt.excluded[col] for col in columns + ('date_recorded',)},
+            where=stmt.excluded['date_recorded'] >= table.c['date_recorded']
+        ))
+        return
+
+    # Other databases: conditional update, then insert the locations with no row yet
+    for value in values:
+        result = connection.execute(
+            update(table)
+            .where(table.c['location_id'] == value['location_id'])
+            .where(table.c['date_recorded'] <= value['date_recorded'])
+            .values(value)
+        )
+        if result.rowcount == 0:
+            exists = connection.execute(
+                select(table.c['location_id']).where(table.c['location_id'] == value['location_id'])
+            ).first()
+            if exists is None:
+                connection.execute(insert(table).values(value))
+
+
+def apply_latest(connection, model, rows: Iterable[Mapping]) -> None:
+    """
+    Fold history rows of model (SoilData or WeatherData) into its latest
+    table on the given connection, so they commit together. Rows are
+    mappings with location_id, date_recorded and the value columns.
+    """
+    latest_model, columns = LATEST_TABLES[model]
+    _upsert_latest(connection, latest_model, columns, _newest_per_location(rows, columns).values())
+
+
+def _register(model) -> None:
+    _, columns = LATEST_TABLES[model]
+
+    def inserted(mapper, connection, target) -> None:
+        apply_latest(connection, model, [{
+            col: getattr(target, col) for col in columns + ('location_id', 'date_recorded')
+        }])
+
+    event.listen(model, 'after_insert', inserted)
+    # Write-behind bulk inserts skip ORM events
+    register_flush_hook(model, lambda connection, rows: apply_latest(connection, model, rows))
+
+
+for _model in LATEST_TABLES:
+    _register(_model)
+
+
+def rebuild_latest_observations() -> None:
+    """Recompute the latest tables from history (e.g. after merging or pruning locations)."""
+    for model, (latest_model, columns) in LATEST_TABLES.items():
+        newer = aliased(model)
+        newest_id = (
+            select(newer.id)
+            .where(newer.location_id == model.location_id)
+            .order_by(newer.date_recorded.desc(), newer.id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+        query = select(
+            model.location_id, *[getattr(model, col) for col in columns],
+            func.coalesce(model.date_recorded, func.now())
+        ).where(model.id == newest_id)
+        db.session.execute(latest_model.__table__.delete())
+        db.session.execute(insert(latest_model.__table__).from_select(
+            ['location_id', *columns, 'date_recorded'], query
+        ))
+    db.session.commit()
+
+
+def latest_soil(location_id: int) -> Optional[LatestSoil]:
+    return db.session.get(LatestSoil, location_id)
+
+
+def latest_weather(location_id: int) -> Optional[LatestWeather]:
+    return db.session.get(LatestWeather, location_id)
+
+
+def is_unchanged(model, row: Mapping) -> bool:
+    """
+    True if row carries the same values as its location's latest observation,
+    counting rows this process has queued but not yet flushed. Rows still
+    buffered in other worker processes are not visible here, so an occasional
+    repeat can be stored; `flask prune-observations` removes those later.
+    """
+    latest_model, columns = LATEST_TABLES[model]
+    pending = _pending.get((model, row['location_id']))
+    if pending is not MISSING:
+        return pending == tuple(row[col] for col in columns)
+    current = db.session.get(latest_model, row['location_id'])
+    return current is not None and all(getattr(current, col) == row[col] for col in columns)
+
+
+def record_observation(model, row: Dict) -> bool:
+    """
+    Queue a SoilData/WeatherData row unless it repeats the latest observation
+    (cached soil and weather lookups return the same values many times over).
+    Returns whether the row was queued.
+    """
+    if SKIP_UNCHANGED_OBSERVATIONS and is_unchanged(model, row):
+        return False
+    write_behind.enqueue(model, row)
+    if WRITE_BEHIND_ENABLED:
+        _, columns = LATEST_TABLES[model]
+        _pending.set((model, row['location_id']), tuple(row[col] for col in columns))
+    return True
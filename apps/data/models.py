@@ -3,6 +3,12 @@ from datetime import datetime
 
 class SoilData(db.Model):
     __tablename__ = 'soil_data'
+    __table_args__ = (
+        # Latest reading for a location: WHERE location_id = ? ORDER BY date_recorded DESC
+        db.Index('ix_soil_data_location_id_date', 'location_id', 'date_recorded'),
+        # Keyset listing: ORDER BY date_recorded DESC, id DESC
+        db.Index('ix_soil_data_date_id', 'date_recorded', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False)
@@ -19,6 +25,12 @@ class SoilData(db.Model):
 
 class WeatherData(db.Model):
     __tablename__ = 'weather_data'
+    __table_args__ = (
+        # Latest reading for a location: WHERE location_id = ? ORDER BY date_recorded DESC
+        db.Index('ix_weather_data_location_id_date', 'location_id', 'date_recorded'),
+        # Keyset listing: ORDER BY date_recorded DESC, id DESC
+        db.Index('ix_weather_data_date_id', 'date_recorded', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False)
@@ -31,3 +43,78 @@ class WeatherData(db.Model):
 
     def __repr__(self):
         return f"<WeatherData location={self.location_id} Temp={self.temperature}>"
+
+
+class LatestSoil(db.Model):
+    """Most recent SoilData values per location, kept current by apps.data.latest."""
+    __tablename__ = 'latest_soil'
+
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), primary_key=True)
+    nitrogen = db.Column(db.Float, nullable=False)
+    phosphorus = db.Column(db.Float, nullable=False)
+    potassium = db.Column(db.Float, nullable=False)
+    ph = db.Column(db.Float, nullable=False)
+    date_recorded = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<LatestSoil location={self.location_id} N={self.nitrogen}>"
+
+
+class LatestWeather(db.Model):
+    """Most recent WeatherData values per location, kept current by apps.data.latest."""
+    __tablename__ = 'latest_weather'
+
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), primary_key=True)
+    temperature = db.Column(db.Float, nullable=False)
+    humidity = db.Column(db.Float, nullable=False)
+    rainfall = db.Column(db.Float, nullable=False)
+    date_recorded = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<LatestWeather location={self.location_id} Temp={self.temperature}>"
+
+
+class InsightCache(db.Model):
+    __tablename__ = 'insight_cache'
+
+    # sha256 of crop, location and binned soil/weather inputs
+    cache_key = db.Column(db.String(64), primary_key=True)
+    crop = db.Column(db.String(100), nullable=False)
+    location_name = db.Column(db.String(255), nullable=True)
+    insights = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_accessed = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<InsightCache crop={self.crop} location={self.location_name}>"
+
+
+class InsightJob(db.Model):
+    """Background Grok insight job, shared by every worker process (see apps.data.insights)."""
+    __tablename__ = 'insight_jobs'
+
+    job_id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(16), nullable=False)  # pending, done or error
+    crop = db.Column(db.String(100), nullable=False)
+    result = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<InsightJob {self.job_id} {self.status}>"
+
+
+class GeocodeCache(db.Model):
+    __tablename__ = 'geocode_cache'
+
+    # Normalized address (see apps.data.geocode_cache.normalize_address)
+    query_key = db.Column(db.String(255), primary_key=True)
+    address = db.Column(db.String(255), nullable=False)  # As first queried, before normalization
+    found = db.Column(db.Boolean, nullable=False)  # False caches a "no result" answer
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    display_name = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<GeocodeCache {self.query_key} found={self.found}>"
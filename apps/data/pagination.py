@@ -0,0 +1,64 @@
+import os
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+# Rows per page when the client does not ask for a size
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+# Largest page a client may request
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+
+class InvalidPageRequest(ValueError):
+    """Raised for a malformed cursor or page size."""
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded).decode('ascii').split('|')
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidPageRequest(f"Invalid cursor: {cursor}") from e
+
+
+def page_args(args) -> Tuple[Optional[str], int]:
+    """(cursor, limit) from request args, with the limit clamped to MAX_PAGE_SIZE."""
+    try:
+        limit = int(args.get('limit', PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise InvalidPageRequest("limit must be an integer")
+    if limit < 1:
+        raise InvalidPageRequest("limit must be positive")
+    return args.get('cursor') or None, min(limit, MAX_PAGE_SIZE)
+
+
+def keyset_page(query, time_column, id_column, cursor: Optional[str] = None,
+                limit: int = PAGE_SIZE) -> Tuple[List, Optional[str]]:
+    """
+    One page of query ordered newest first by (time_column, id_column).
+
+    The cursor is the (time, id) of the last row of the previous page, so
+    each page is an index range scan that starts where the last one ended;
+    unlike OFFSET, cost does not grow with how deep the client has paged.
+    Returns (rows, next_cursor), where next_cursor is None on the last page.
+    """
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            time_column < timestamp,
+            and_(time_column == timestamp, id_column < row_id)
+        ))
+    rows = query.order_by(time_column.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
@@ -0,0 +1,222 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+from apps import db
+from apps.crop.models import Location
+from apps.crop.util import get_or_create_location as find_or_create_location
+from apps.data.circuit import CircuitOpenError
+from apps.data.http_client import count_upstream_calls
+from apps.data.latest import latest_soil, latest_weather, record_observation
+from apps.data.models import SoilData, WeatherData
+from apps.data.util import (
+    get_lat_lon,
+    request_soil_data,
+    lookup_weather,
+    SOIL_FALLBACK,
+    WEATHER_FALLBACK
+)
+from apps.data.weather_cache import coordinate_query, link_weather_query
+
+logger = logging.getLogger(__name__)
+
+# Overall time budget (seconds) for the concurrent soil + weather fetch
+FEATURE_FETCH_DEADLINE = float(os.getenv("FEATURE_FETCH_DEADLINE", "12"))
+FEATURE_FETCH_WORKERS = int(os.getenv("FEATURE_FETCH_WORKERS", "8"))
+
+# Shared pool so soil and weather lookups for a request run side by side
+_fetch_executor = ThreadPoolExecutor(max_workers=FEATURE_FETCH_WORKERS, thread_name_prefix="feature-fetch")
+
+
+class FeatureAssemblyError(Exception):
+    """Raised when model input features cannot be assembled for a location."""
+
+
+def get_or_create_location(lat: float, lon: float, display_name: str) -> Location:
+    """
+    Return the Location stored near these coordinates, creating it if needed.
+    """
+    try:
+        return find_or_create_location(lat, lon, display_name)
+    except Exception as e:
+        logger.error(f"Error saving location to database: {str(e)}")
+        raise FeatureAssemblyError('Failed to save location to database')
+
+
+class FeatureAssembler:
+    """
+    Assemble model input features for a location name.
+
+    Geocoding, soil and weather are each looked up once; the same values
+    are returned as the model features and, when they differ from the
+    location's latest observation, persisted as SoilData/WeatherData rows.
+    Soil and weather run concurrently under one deadline, so the stage
+    costs the slower of the two; a source that fails or misses the deadline
+    is replaced by the location's latest stored observation (or the global
+    fallback values if it has none) and flagged. Per-stage timings, the
+    outbound requests each stage actually sent and which stages were
+    answered from cache are recorded for the response.
+    """
+
+    def __init__(self, location_name: str, persist: bool = True):
+        self.location_name = location_name
+        self.persist = persist
+        self.geo: Optional[Dict] = None
+        self.location: Optional[Location] = None
+        self.soil: Optional[Dict[str, float]] = None
+        self.weather: Optional[Dict[str, float]] = None
+        self.features: Optional[Dict[str, float]] = None
+        self.timings: Dict[str, float] = {}
+        self.fallbacks: Dict[str, bool] = {'soil': False, 'weather': False}
+        self.degraded_reasons: Dict[str, str] = {}
+        self.fallback_sources: Dict[str, str] = {}
+        self.cache: Dict[str, str] = {}
+        self.upstream_calls: Dict[str, int] = {}
+
+    @contextmanager
+    def _stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def _timed(self, name: str, fetch, *args, **kwargs):
+        start = time.perf_counter()
+        with count_upstream_calls() as calls:
+            try:
+                return fetch(*args, **kwargs)
+            finally:
+                self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+                self.upstream_calls[name] = sum(calls.values())
+
+    def _result_or_fallback(self, name: str, future, deadline: float, fallback: Dict[str, float]) -> Dict[str, float]:
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except CircuitOpenError:
+            logger.warning(f"{name} circuit open for {self.location_name}, using fallback data")
+            self.degraded_reasons[name] = 'circuit_open'
+        except FutureTimeoutError:
+            logger.warning(f"{name} lookup for {self.location_name} missed the deadline, using fallback data")
+            self.degraded_reasons[name] = 'timeout'
+        except Exception as e:
+            logger.warning(f"{name} lookup for {self.location_name} failed, using fallback data: {str(e)}")
+            self.degraded_reasons[name] = 'error'
+        self.fallbacks[name] = True
+        return dict(fallback)
+
+    def _latest_or_fallback(self, name: str, fallback: Dict[str, float]) -> Dict[str, float]:
+        # Primary-key lookup on the latest-observation table; history is not scanned
+        try:
+            if name == 'soil':
+                row = latest_soil(self.location.id)
+                latest = row and {"N": row.nitrogen, "P": row.phosphorus, "K": row.potassium, "ph": row.ph}
+            else:
+                row = latest_weather(self.location.id)
+                latest = row and {"temperature": row.temperature, "humidity": row.humidity, "rainfall": row.rainfall}
+        except Exception as e:
+            logger.error(f"Error reading latest {name} for location {self.location.id}: {str(e)}")
+            latest = None
+        if latest:
+            self.fallback_sources[name] = 'latest_observation'
+            return latest
+        self.fallback_sources[name] = 'default'
+        return fallback
+
+    def _lookup_weather(self, lat: float, lon: float) -> Dict[str, float]:
+        weather, meta = lookup_weather(self.location_name)
+        self.cache['weather'] = meta['cache']
+        # Lets the prefetcher, which queries by the Location's coordinates, refresh this entry
+        link_weather_query(coordinate_query(lat, lon), meta['location_key'])
+        return weather
+
+    def assemble(self) -> Dict[str, float]:
+        self.geo = self._timed('geocode', get_lat_lon, self.location_name)
+        self.cache['geocode'] = 'hit' if self.geo and not self.upstream_calls['geocode'] else 'miss'
+        if not self.geo or 'lat' not in self.geo or 'lon' not in self.geo:
+            raise FeatureAssemblyError('Failed to get geolocation data')
+
+        lat, lon = self.geo['lat'], self.geo['lon']
+        display_name = self.geo.get('display_name', self.location_name)
+
+        with self._stage('location'):
+            self.location = get_or_create_location(lat, lon, display_name)
+
+        with self._stage('soil_weather'):
+            deadline = time.monotonic() + FEATURE_FETCH_DEADLINE
+            soil_future = _fetch_executor.submit(
+                self._timed, 'soil', request_soil_data, lat, lon, deadline=deadline
+            )
+            weather_future = _fetch_executor.submit(
+                self._timed, 'weather', self._lookup_weather,
+                self.location.latitude, self.location.longitude
+            )
+            self.soil = self._result_or_fallback('soil', soil_future, deadline, SOIL_FALLBACK)
+            self.weather = self._result_or_fallback('weather', weather_future, deadline, WEATHER_FALLBACK)
+            # A missed deadline leaves the lookup running, so its calls are not known yet
+            self.cache['soil'] = 'hit' if not self.fallbacks['soil'] and not self.upstream_calls.get('soil') else 'miss'
+            if self.fallbacks['soil']:
+                self.soil = self._latest_or_fallback('soil', self.soil)
+            if self.fallbacks['weather']:
+                self.weather = self._latest_or_fallback('weather', self.weather)
+
+        self.features = {
+            "N": self.soil["N"],
+            "P": self.soil["P"],
+            "K": self.soil["K"],
+            "ph": self.soil["ph"],
+            "temperature": self.weather["temperature"],
+            "humidity": self.weather["humidity"],
+            "rainfall": self.weather["rainfall"]
+        }
+        if any(v is None for v in self.features.values()):
+            raise FeatureAssemblyError('Failed to fetch complete model input features')
+
+        if self.persist:
+            with self._stage('persist'):
+                self._persist()
+
+        return self.features
+
+    def _persist(self) -> None:
+        # Buffered and bulk-inserted by the write-behind queue, off the request path.
+        # Fallback values are not observations, so they never reach history or
+        # the latest-observation tables; unchanged readings are not stored again.
+        now = datetime.utcnow()
+        try:
+            if not self.fallbacks['soil']:
+                record_observation(SoilData, {
+                    'location_id': self.location.id,
+                    'nitrogen': self.soil['N'],
+                    'phosphorus': self.soil['P'],
+                    'potassium': self.soil['K'],
+                    'ph': self.soil['ph'],
+                    'date_recorded': now
+                })
+            if not self.fallbacks['weather']:
+                record_observation(WeatherData, {
+                    'location_id': self.location.id,
+                    'temperature': self.weather['temperature'],
+                    'humidity': self.weather['humidity'],
+                    'rainfall': self.weather['rainfall'],
+                    'date_recorded': now
+                })
+        except Exception as e:
+            # Continue to allow prediction even if the save fails
+            logger.error(f"Error saving soil/weather data to database: {str(e)}")
+
+    def report(self) -> Dict:
+        return {
+            'timings_ms': dict(self.timings),
+            'upstream_lookups': sum(self.upstream_calls.values()),
+            'upstream_calls': dict(self.upstream_calls),
+            'fallbacks': dict(self.fallbacks),
+            'degraded': any(self.fallbacks.values()),
+            'degraded_reasons': dict(self.degraded_reasons),
+            'fallback_sources': dict(self.fallback_sources),
+            'cache': dict(self.cache)
+        }
@@ -0,0 +1,239 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: no cross-process election
+    fcntl = None
+
+from apps import db
+from apps.crop.models import Location
+from apps.model.models import Prediction
+from apps.data.circuit import CircuitOpenError
+from apps.data.soil_cache import soil_cache
+from apps.data.weather_cache import coordinate_query, get_cached_weather, share_weather, weather_location_key
+from apps.data.util import lookup_weather, request_soil_data
+
+logger = logging.getLogger(__name__)
+
+# Run the scheduler thread inside the web process
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "False") == "True"
+# How many of the most-predicted locations are kept warm
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "50"))
+# Seconds per refresh cycle; the cycle's lookups are spaced evenly across it
+PREFETCH_INTERVAL = int(os.getenv("PREFETCH_INTERVAL", "900"))
+# Only predictions from the last N days decide which locations are popular
+PREFETCH_LOOKBACK_DAYS = int(os.getenv("PREFETCH_LOOKBACK_DAYS", "30"))
+# Refresh weather that expires within this many seconds
+PREFETCH_WEATHER_AHEAD = int(os.getenv("PREFETCH_WEATHER_AHEAD", "900"))
+# Refresh soil that expires within this many seconds
+PREFETCH_SOIL_AHEAD = int(os.getenv("PREFETCH_SOIL_AHEAD", str(7 * 24 * 3600)))
+# Only the worker holding this lock runs the scheduler
+PREFETCH_LOCK_FILE = os.getenv(
+    "PREFETCH_LOCK_FILE",
+    os.path.join(tempfile.gettempdir(), "smartfarm_prefetch.lock")
+)
+
+
+def popular_locations(limit: int = PREFETCH_TOP_N,
+                      lookback_days: int = PREFETCH_LOOKBACK_DAYS) -> List[Dict]:
+    """The most-predicted locations with coordinates, busiest first."""
+    since = datetime.utcnow() - timedelta(days=lookback_days)
+    rows = (
+        db.session.query(Location.id, Location.name, Location.latitude, Location.longitude,
+                         func.count(Prediction.id).label('predictions'))
+        .join(Prediction, Prediction.location_id == Location.id)
+        .filter(Prediction.timestamp >= since,
+                Location.latitude.isnot(None), Location.longitude.isnot(None))
+        .group_by(Location.id, Location.name, Location.latitude, Location.longitude)
+        .order_by(func.count(Prediction.id).desc())
+        .limit(limit)
+        .all()
+    )
+    return [
+        {'id': r.id, 'name': r.name, 'lat': r.latitude, 'lon': r.longitude, 'predictions': r.predictions}
+        for r in rows
+    ]
+
+
+def weather_needs_refresh(location: Dict, now: float) -> bool:
+    entry = get_cached_weather(coordinate_query(location['lat'], location['lon']))
+    return entry is None or entry['expires_at'] - now <= PREFETCH_WEATHER_AHEAD
+
+
+def refresh_weather(location: Dict) -> None:
+    """
+    Refetch weather by the Location's coordinates, which WeatherAPI always
+    resolves (unlike long Nominatim display names). User lookups link the
+    coordinates to the entry their queries resolved to, so the fresh answer
+    is copied there and every alias of that entry is warmed.
+    """
+    query = coordinate_query(location['lat'], location['lon'])
+    linked_key = weather_location_key(query)
+    lookup_weather(query, refresh=True)
+    entry = get_cached_weather(query)
+    if entry and linked_key and linked_key != entry['location_key']:
+        share_weather(entry, linked_key)
+
+
+def soil_needs_refresh(location: Dict, now: float) -> bool:
+    fetched_at = soil_cache.fetched_at(location['lat'], location['lon'])
+    return fetched_at is None or fetched_at + soil_cache.ttl - now <= PREFETCH_SOIL_AHEAD
+
+
+def refresh_location(location: Dict, weather: bool = True) -> Dict[str, str]:
+    """Refresh whichever of a location's caches are close to expiry."""
+    now = time.time()
+    outcome = {}
+    if weather and weather_needs_refresh(location, now):
+        try:
+            refresh_weather(location)
+            outcome['weather'] = 'refreshed'
+        except CircuitOpenError:
+            outcome['weather'] = 'circuit_open'
+        except Exception as e:
+            logger.warning(f"Weather prefetch for {location['name']} failed: {str(e)}")
+            outcome['weather'] = 'error'
+    elif weather:
+        outcome['weather'] = 'fresh'
+
+    try:
+        needs_soil = soil_needs_refresh(location, now)
+    except Exception as e:
+        logger.error(f"Soil cache check failed: {str(e)}")
+        needs_soil = False
+    if needs_soil:
+        try:
+            request_soil_data(location['lat'], location['lon'], retries=1, refresh=True)
+            outcome['soil'] = 'refreshed'
+        except CircuitOpenError:
+            outcome['soil'] = 'circuit_open'
+        except Exception as e:
+            logger.warning(f"Soil prefetch for {location['name']} failed: {str(e)}")
+            outcome['soil'] = 'error'
+    else:
+        outcome['soil'] = 'fresh'
+    return outcome
+
+
+def run_cycle(interval: float = 0, stop: Optional[threading.Event] = None,
+              weather: bool = True) -> Dict[str, int]:
+    """
+    Refresh the popular locations once. With an interval, location i is
+    handled at i * interval / N seconds into the cycle, so refresh traffic
+    is a steady trickle rather than a burst; stop ends the cycle early.
+    weather=False refreshes only the soil cache, which is shared between processes.
+    """
+    started = time.monotonic()
+    locations = popular_locations()
+    db.session.remove()  # don't hold a pooled connection while sleeping
+    counts: Dict[str, int] = {}
+    spacing = interval / len(locations) if locations else 0
+    for i, location in enumerate(locations):
+        wait = started + i * spacing - time.monotonic()
+        if wait > 0 and stop is not None and stop.wait(wait):
+            break
+        if wait > 0 and stop is None:
+            time.sleep(wait)
+        for source, result in refresh_location(location, weather).items():
+            key = f"{source}_{result}"
+            counts[key] = counts.get(key, 0) + 1
+    logger.info(f"Prefetch cycle over {len(locations)} locations: {counts}")
+    return counts
+
+
+class PrefetchScheduler:
+    """
+    Background thread that keeps the hottest locations' caches warm.
+
+    Every gunicorn worker may start one, but only the worker holding the
+    prefetch file lock does any work, so upstream traffic does not scale
+    with the worker count. (The weather cache is per process, so with
+    several workers only the elected one has prefetched weather.)
+    """
+
+    def __init__(self, app, interval: float = PREFETCH_INTERVAL, lock_path: str = PREFETCH_LOCK_FILE,
+                 weather: bool = True):
+        self.app = app
+        self.interval = interval
+        self.weather = weather
+        self.lock_path = lock_path
+        self._stop = threading.Event()
+        self._lock_fd: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _elect(self) -> bool:
+        if self._lock_fd is not None:
+            return True
+        if fcntl is None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            if self._elect():
+                try:
+                    with self.app.app_context():
+                        run_cycle(self.interval, self._stop, self.weather)
+                except Exception as e:
+                    logger.error(f"Prefetch cycle failed: {str(e)}")
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+_scheduler: Optional[PrefetchScheduler] = None
+
+
+def start_prefetch_scheduler(app) -> Optional[PrefetchScheduler]:
+    """Start the in-process scheduler once, if PREFETCH_ENABLED is set."""
+    global _scheduler
+    if not PREFETCH_ENABLED or _scheduler is not None:
+        return _scheduler
+    _scheduler = PrefetchScheduler(app)
+    _scheduler.start()
+    logger.info(f"Prefetch scheduler started (top {PREFETCH_TOP_N} locations every {PREFETCH_INTERVAL}s)")
+    return _scheduler
+
+
+@click.command('prefetch')
+@click.option('--once', is_flag=True, help='Run a single cycle without spacing and exit.')
+@click.option('--interval', default=PREFETCH_INTERVAL, show_default=True, help='Seconds per cycle.')
+@with_appcontext
+def prefetch_command(once: bool, interval: int) -> None:
+    """
+    Keep the soil cache warm for the most-predicted locations from a separate process.
+    Weather is cached per process, so refreshing it here would warm nothing
+    and spend WeatherAPI quota; web workers keep it warm with PREFETCH_ENABLED=True.
+    """
+    if once:
+        click.echo(run_cycle(weather=False))
+        return
+    scheduler = PrefetchScheduler(current_app._get_current_object(), interval=interval, weather=False)
+    try:
+        scheduler._run()
+    except KeyboardInterrupt:
+        scheduler.stop()
@@ -0,0 +1,85 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: limit per process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a caller would have to wait past its deadline for a slot."""
+
+
+class FileTokenBucket:
+    """
+    Token bucket shared by every worker process on the host.
+
+    The bucket state (tokens, last refill time) lives in a small file that
+    is read and rewritten under an exclusive flock, so all gunicorn workers
+    draw from the same budget. Tokens may go negative: each caller reserves
+    the next free slot and sleeps until it, which queues callers in arrival
+    order. A caller whose slot would land after its deadline is rejected
+    without reserving anything, so it fails fast instead of holding a worker.
+    """
+
+    def __init__(self, path: str, rate: float, capacity: float = 1.0):
+        self.path = path
+        self.rate = rate
+        self.capacity = capacity
+        self._thread_lock = threading.Lock()
+
+    def _read(self, fd: int):
+        os.lseek(fd, 0, os.SEEK_SET)
+        raw = os.read(fd, 64).decode('ascii', 'ignore').split()
+        try:
+            return float(raw[0]), float(raw[1])
+        except (IndexError, ValueError):
+            return self.capacity, time.time()
+
+    def _write(self, fd: int, tokens: float, stamp: float) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{tokens:.6f} {stamp:.6f}".encode('ascii'))
+
+    def _reserve(self, max_wait: float) -> float:
+        with self._thread_lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                now = time.time()
+                tokens, stamp = self._read(fd)
+                tokens = min(self.capacity, tokens + (now - stamp) * self.rate)
+                wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+                if wait > max_wait:
+                    raise RateLimitExceeded(f"Next slot in {wait:.1f}s exceeds the {max_wait:.1f}s deadline")
+                self._write(fd, tokens - 1, now)
+                return wait
+            finally:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def acquire(self, max_wait: float) -> None:
+        """Wait for a slot, raising RateLimitExceeded if it is more than max_wait seconds away."""
+        wait = self._reserve(max_wait)
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Nominatim usage policy: at most 1 request per second for the whole application
+NOMINATIM_RATE = float(os.getenv("NOMINATIM_RATE", "1"))
+# Default seconds a geocoding caller will queue for a slot before failing fast
+NOMINATIM_MAX_WAIT = float(os.getenv("NOMINATIM_MAX_WAIT", "5"))
+NOMINATIM_BUCKET_FILE = os.getenv(
+    "NOMINATIM_BUCKET_FILE",
+    os.path.join(tempfile.gettempdir(), "smartfarm_nominatim.bucket")
+)
+
+nominatim_limiter = FileTokenBucket(NOMINATIM_BUCKET_FILE, rate=NOMINATIM_RATE, capacity=1)
@@ -0,0 +1,160 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, or_, select, update
+
+from apps import db
+from apps.data.latest import LATEST_TABLES, rebuild_latest_observations
+from apps.data.models import SoilData, WeatherData
+
+logger = logging.getLogger(__name__)
+
+# Readings newer than this many days are kept as recorded
+RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "30"))
+# Older readings are averaged per day up to this age, and per week beyond it
+RETENTION_DAILY_DAYS = int(os.getenv("RETENTION_DAILY_DAYS", "365"))
+# Rows read per query while walking a location's history
+RETENTION_CHUNK_SIZE = int(os.getenv("RETENTION_CHUNK_SIZE", "5000"))
+
+# Weekly buckets start on Monday
+_EPOCH_MONDAY = datetime(1970, 1, 5)
+
+
+def day_bucket(when: datetime) -> datetime:
+    return datetime(when.year, when.month, when.day)
+
+
+def week_bucket(when: datetime) -> datetime:
+    return _EPOCH_MONDAY + timedelta(weeks=(day_bucket(when) - _EPOCH_MONDAY).days // 7)
+
+
+def _walk(model, columns, location_id: int, before: Optional[datetime] = None):
+    """Rows of one location oldest first, read in keyset chunks so memory stays bounded."""
+    cursor = None
+    while True:
+        query = select(model.id, model.date_recorded, *[getattr(model, col) for col in columns]).where(
+            model.location_id == location_id, model.date_recorded.isnot(None)
+        )
+        if before is not None:
+            query = query.where(model.date_recorded < before)
+        if cursor is not None:
+            query = query.where(or_(
+                model.date_recorded > cursor[0],
+                and_(model.date_recorded == cursor[0], model.id > cursor[1])
+            ))
+        rows = db.session.execute(
+            query.order_by(model.date_recorded, model.id).limit(RETENTION_CHUNK_SIZE)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        cursor = (rows[-1].date_recorded, rows[-1].id)
+
+
+def _delete_ids(model, ids: List[int]) -> None:
+    for start in range(0, len(ids), 1000):
+        db.session.execute(model.__table__.delete().where(model.id.in_(ids[start:start + 1000])))
+
+
+def downsample_location(model, location_id: int, raw_before: datetime, daily_before: datetime,
+                        dry_run: bool = False) -> int:
+    """
+    Replace each day (or week, before daily_before) of readings older than
+    raw_before with one row holding their averages, dated at the start of
+    the bucket. Buckets already down to one row are left alone, so the job
+    can be re-run; a week built from daily rows averages the daily values.
+    Returns the number of rows removed.
+    """
+    _, columns = LATEST_TABLES[model]
+    removed = 0
+    bucket_key, bucket_rows = None, []
+
+    def close_bucket() -> int:
+        if len(bucket_rows) < 2:
+            return 0
+        if not dry_run:
+            averages = {col: sum(getattr(row, col) for row in bucket_rows) / len(bucket_rows) for col in columns}
+            db.session.execute(
+                update(model).where(model.id == bucket_rows[0].id).values(date_recorded=bucket_key, **averages)
+            )
+            _delete_ids(model, [row.id for row in bucket_rows[1:]])
+        return len(bucket_rows) - 1
+
+    for rows in _walk(model, columns, location_id, before=raw_before):
+        for row in rows:
+            bucket = week_bucket if row.date_recorded < daily_before else day_bucket
+            key = bucket(row.date_recorded)
+            if key != bucket_key:
+                removed += close_bucket()
+                bucket_key, bucket_rows = key, []
+            bucket_rows.append(row)
+    removed += close_bucket()
+    return removed
+
+
+def dedupe_location(model, location_id: int, dry_run: bool = False) -> int:
+    """Delete readings whose values repeat the previous reading; the first of each run is kept."""
+    _, columns = LATEST_TABLES[model]
+    removed, previous = 0, None
+    for rows in _walk(model, columns, location_id):
+        repeats = []
+        for row in rows:
+            values = tuple(getattr(row, col) for col in columns)
+            if values == previous:
+                repeats.append(row.id)
+            previous = values
+        if repeats and not dry_run:
+            _delete_ids(model, repeats)
+        removed += len(repeats)
+    return removed
+
+
+def prune_observations(raw_days: int = RETENTION_RAW_DAYS, daily_days: int = RETENTION_DAILY_DAYS,
+                       dry_run: bool = False) -> Dict[str, Dict[str, int]]:
+    """
+    Downsample and dedupe SoilData and WeatherData history, one location
+    per transaction, then rebuild the latest tables, whose rows may point at
+    readings that were merged or deleted. Returns rows removed per table and step.
+    """
+    now = datetime.utcnow()
+    raw_before = now - timedelta(days=raw_days)
+    daily_before = now - timedelta(days=max(daily_days, raw_days))
+    summary = {}
+    for model in (SoilData, WeatherData):
+        downsampled = deduped = 0
+        location_ids = db.session.execute(select(model.location_id).distinct()).scalars().all()
+        for location_id in location_ids:
+            try:
+                downsampled += downsample_location(model, location_id, raw_before, daily_before, dry_run)
+                deduped += dedupe_location(model, location_id, dry_run)
+                if dry_run:
+                    db.session.rollback()
+                else:
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Pruning {model.__tablename__} for location {location_id} failed: {str(e)}")
+        summary[model.__tablename__] = {'downsampled': downsampled, 'deduped': deduped}
+        logger.info(f"Pruned {model.__tablename__}: {downsampled} rows downsampled, {deduped} repeats removed")
+    if not dry_run:
+        rebuild_latest_observations()
+    return summary
+
+
+@click.command('prune-observations')
+@click.option('--raw-days', default=RETENTION_RAW_DAYS, show_default=True,
+              help='Keep readings newer than this many days as recorded.')
+@click.option('--daily-days', default=RETENTION_DAILY_DAYS, show_default=True,
+              help='Average older readings per day up to this age, per week beyond it.')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without changing anything.')
+@with_appcontext
+def prune_observations_command(raw_days: int, daily_days: int, dry_run: bool) -> None:
+    """Downsample old soil/weather history and remove repeated readings."""
+    summary = prune_observations(raw_days, daily_days, dry_run)
+    for table, counts in summary.items():
+        click.echo(f"{table}: {'would remove' if dry_run else 'removed'} "
+                   f"{counts['downsampled']} rows by downsampling, {counts['deduped']} repeated readings")
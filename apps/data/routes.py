@@ -1,24 +1,42 @@
-from flask import Blueprint, render_template, request, jsonify, send_file, make_response
+from flask import Blueprint, render_template, request, jsonify, send_file, make_response, Response, stream_with_context
 from flask_login import current_user, login_required
 from flask_wtf import CSRFProtect
 from apps.data.util import (
     get_lat_lon,
-    fetch_soil_data,
-    get_model_input_features,
-    fetch_weather_data,
-    get_grok_crop_recommendation
-
+    request_soil_data,
+    lookup_weather,
+    SOIL_FALLBACK,
+    WEATHER_FALLBACK
 )
-from apps.data.models import SoilData, WeatherData
+from apps.data.circuit import breakers
+from apps.data.pipeline import FeatureAssembler, FeatureAssemblyError
+from apps.data.insight_cache import get_crop_insights
+from apps.data.insights import submit_insight_job, get_insight_job, wait_for_insight_job
+from apps.data.models import SoilData, WeatherData, LatestSoil
+from apps.data import write_behind
+from apps.data.weather_cache import coordinate_query, link_weather_query
+from apps.data.latest import latest_soil, latest_weather, record_observation
+from apps.data.pagination import keyset_page, page_args, InvalidPageRequest
 from apps.crop.models import Location
+from apps.crop.util import get_or_create_location
+from apps.analytics.util import location_crop_counts, user_crop_counts
 from apps.model.models import Prediction
+from apps.model.util import (
+    normalize_features,
+    score_batch,
+    score_probabilities,
+    build_feature_matrix,
+    decode_classes,
+    HybridRuleEngine
+)
 from apps import db
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy import func
+from apps.replica import reads_from_replica, use_replica
+from sqlalchemy.orm import joinedload
 import joblib
 import os
 import numpy as np
 import pandas as pd
+import json
 import logging
 from datetime import datetime
 from reportlab.lib.pagesizes import letter, A4
@@ -59,10 +77,14 @@ try:
     except Exception:
         logger.info("Model does not expose feature_names_in_")
     logger.info(f"Label encoder classes: {list(label_encoder.classes_)}")
+    # Compile the hybrid rule engine once against the model's class order;
+    # it recompiles itself when the rule file changes
+    hybrid_rules = HybridRuleEngine(decode_classes(model, label_encoder))
 except Exception as e:
     logger.error(f"Error loading model or label encoder: {str(e)}")
     model = None
     label_encoder = None
+    hybrid_rules = None
 
 
 @blueprint.route('/chat')
@@ -155,14 +177,17 @@ def get_user_predictions():
         return jsonify({'error': 'Authentication required'}), 401
 
     try:
-        # Fetch user's predictions with location info, ordered by most recent
-        predictions = db.session.query(Prediction, Location).join(
-            Location, Prediction.location_id == Location.id
-        ).filter(
-            Prediction.user_id == current_user.id
-        ).order_by(
-            Prediction.timestamp.desc()
-        ).limit(50).all()  # Limit to last 50 predictions
+        # History reads go to the replica; the session user above was loaded from the primary
+        with use_replica():
+            # Fetch user's predictions with location info, ordered by most recent
+            predictions = db.session.query(Prediction, Location).join(
+                Location, Prediction.location_id == Location.id
+            ).filter(
+                Prediction.user_id == current_user.id
+            ).order_by(
+                Prediction.timestamp.desc()
+            ).limit(50).all()  # Limit to last 50 predictions
+            crop_counts = user_crop_counts(current_user.id)
 
         predictions_list = []
         for pred, loc in predictions:
@@ -182,7 +207,10 @@ def get_user_predictions():
                 'rainfall': pred.rainfall
             })
 
-        return jsonify({'predictions': predictions_list}), 200
+        return jsonify({
+            'predictions': predictions_list,
+            'crop_counts': crop_counts
+        }), 200
     except Exception as e:
         logger.error(f"Error fetching user predictions: {str(e)}")
         return jsonify({'error': 'Failed to fetch predictions'}), 500
@@ -328,9 +356,9 @@ def download_prediction_report(prediction_id):
         )
         content.append(Spacer(1, 40))
 
-        # Add actionable insights from Grok API
+        # Add actionable insights from Grok API (served from the insight cache when available)
         try:
-            actionable_insights = get_grok_crop_recommendation(
+            actionable_insights = get_crop_insights(
                 soil_data={
                     'n': prediction.nitrogen,
                     'p': prediction.phosphorus,
@@ -343,7 +371,8 @@ def download_prediction_report(prediction_id):
                     'rainfall': prediction.rainfall,
                 },
                 crop=prediction.crop_recommended,
-                location_name=location.name
+                location_name=location.name,
+                location_id=prediction.location_id
             )
 
             insights_lines = actionable_insights.split('\n')
@@ -381,77 +410,63 @@ def download_prediction_report(prediction_id):
 
 
 @blueprint.route('/location')
+@reads_from_replica
 def locations():
     # Fetch all locations
     locations = Location.query.all()
 
+    # The per-(location, crop) rollup gives the per-location totals, crop
+    # distribution and most common crop per location, derived in Python.
+    prediction_count_dict = {}
+    crop_totals = {}
+    most_common_crop_dict = {}
+    best_counts = {}
+    for row in location_crop_counts():
+        prediction_count_dict[row.location_id] = prediction_count_dict.get(row.location_id, 0) + row.count
+        crop_totals[row.crop] = crop_totals.get(row.crop, 0) + row.count
+        crop = str(row.crop) if row.crop else 'None'
+        best = best_counts.get(row.location_id)
+        # Highest count wins; ties go to the alphabetically first crop so the table is stable
+        if best is None or row.count > best or (row.count == best and crop < most_common_crop_dict[row.location_id]):
+            best_counts[row.location_id] = row.count
+            most_common_crop_dict[row.location_id] = crop
+
     # Prepare location data for map
     location_data = []
     for loc in locations:
-        prediction_count = Prediction.query.filter_by(location_id=loc.id).count()
         location_data.append({
             'id': loc.id,
             'name': str(loc.name) if loc.name else 'Unknown',
             'latitude': float(loc.latitude) if loc.latitude is not None else 0.0,
             'longitude': float(loc.longitude) if loc.longitude is not None else 0.0,
             'description': str(loc.description) if loc.description else '',
-            'prediction_count': prediction_count
+            'prediction_count': prediction_count_dict.get(loc.id, 0)
         })
 
-    # Get prediction counts per location for bar chart
-    prediction_counts = db.session.query(
-        Location.name,
-        func.count(Prediction.id).label('count')
-    ).join(Prediction, Location.id == Prediction.location_id)\
-     .group_by(Location.id, Location.name)\
-     .all()
+    # Prediction counts per location for bar chart
+    locations_with_predictions = [loc for loc in locations if loc.id in prediction_count_dict]
     prediction_chart_data = {
-        'labels': [str(row.name) if row.name else 'Unknown' for row in prediction_counts],
-        'counts': [row.count for row in prediction_counts]
+        'labels': [str(loc.name) if loc.name else 'Unknown' for loc in locations_with_predictions],
+        'counts': [prediction_count_dict[loc.id] for loc in locations_with_predictions]
     }
 
-    # Get crop distribution for pie chart
-    crop_counts = db.session.query(
-        Prediction.crop_recommended,
-        func.count(Prediction.id).label('count')
-    ).group_by(Prediction.crop_recommended).all()
+    # Crop distribution for pie chart
     crop_chart_data = {
-        'labels': [str(row.crop_recommended) if row.crop_recommended else 'Unknown' for row in crop_counts],
-        'counts': [row.count for row in crop_counts]
+        'labels': [str(crop) if crop else 'Unknown' for crop in crop_totals],
+        'counts': list(crop_totals.values())
     }
 
-    # Get soil data for scatter plot (latest per location)
-    soil_data_query = db.session.query(
-        Location.id,
-        Location.name,
-        SoilData.nitrogen,
-        SoilData.phosphorus,
-        SoilData.potassium
-    ).join(SoilData, Location.id == SoilData.location_id)\
-     .group_by(Location.id, Location.name, SoilData.nitrogen, SoilData.phosphorus, SoilData.potassium)\
-     .all()
+    # Soil scatter: one row per location from the latest-observation table
+    location_names = {loc.id: loc.name for loc in locations}
     soil_chart_data = [
         {
-            'location': str(row.name) if row.name else 'Unknown',
-            'nitrogen': float(row.nitrogen) if row.nitrogen is not None else 0.0,
-            'phosphorus': float(row.phosphorus) if row.phosphorus is not None else 0.0,
-            'potassium': float(row.potassium) if row.potassium is not None else 0.0
-        } for row in soil_data_query
+            'location': str(location_names.get(row.location_id) or 'Unknown'),
+            'nitrogen': float(row.nitrogen),
+            'phosphorus': float(row.phosphorus),
+            'potassium': float(row.potassium)
+        } for row in LatestSoil.query.all()
     ]
 
-    # Get most common crop per location for summary table
-    most_common_crop = db.session.query(
-        Location.id,
-        Prediction.crop_recommended,
-        func.count(Prediction.id).label('count')
-    ).join(Prediction, Location.id == Prediction.location_id)\
-     .group_by(Location.id, Prediction.crop_recommended)\
-     .order_by(Location.id, func.count(Prediction.id).desc())\
-     .distinct(Location.id)\
-     .all()
-
-    most_common_crop_dict = {row.id: str(row.crop_recommended) if row.crop_recommended else 'None' for row in most_common_crop}
-
     summary_data = []
     for loc in locations:
         summary_data.append({
@@ -459,7 +474,7 @@ def locations():
             'name': str(loc.name) if loc.name else 'Unknown',
             'latitude': float(loc.latitude) if loc.latitude is not None else 0.0,
             'longitude': float(loc.longitude) if loc.longitude is not None else 0.0,
-            'prediction_count': Prediction.query.filter_by(location_id=loc.id).count(),
+            'prediction_count': prediction_count_dict.get(loc.id, 0),
             'most_common_crop': most_common_crop_dict.get(loc.id, 'None')
         })
 
@@ -473,18 +488,114 @@ def locations():
     )
 
 
+
+@blueprint.route('/location/<int:location_id>/latest', methods=['GET'])
+def location_latest(location_id):
+    """Current soil and weather for a location, from the latest-observation tables."""
+    soil = latest_soil(location_id)
+    weather = latest_weather(location_id)
+    if soil is None and weather is None and db.session.get(Location, location_id) is None:
+        return jsonify({'error': 'Unknown location_id'}), 404
+    return jsonify({
+        'location_id': location_id,
+        'soil': soil and {
+            'N': soil.nitrogen,
+            'P': soil.phosphorus,
+            'K': soil.potassium,
+            'ph': soil.ph,
+            'date_recorded': soil.date_recorded.isoformat()
+        },
+        'weather': weather and {
+            'temperature': weather.temperature,
+            'humidity': weather.humidity,
+            'rainfall': weather.rainfall,
+            'date_recorded': weather.date_recorded.isoformat()
+        }
+    })
+
+def _soil_page(args):
+    cursor, limit = page_args(args)
+    query = SoilData.query.options(joinedload(SoilData.location))
+    return keyset_page(query, SoilData.date_recorded, SoilData.id, cursor, limit)
+
+
+def _weather_page(args):
+    cursor, limit = page_args(args)
+    query = WeatherData.query.options(joinedload(WeatherData.location))
+    return keyset_page(query, WeatherData.date_recorded, WeatherData.id, cursor, limit)
+
+
+def _location_label(record):
+    return record.location.name if record.location else record.location_id
+
+
 @blueprint.route('/soil')
 def soil():
-    # Query all soil data records
-    soil_records = SoilData.query.all()
-    return render_template('soil/view_soil.html', soil_records=soil_records)
+    # One keyset page of soil records, newest first
+    try:
+        soil_records, next_cursor = _soil_page(request.args)
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+    return render_template('soil/view_soil.html', soil_records=soil_records, next_cursor=next_cursor)
+
+
+@blueprint.route('/soil/records', methods=['GET'])
+def soil_records_api():
+    """Soil records as JSON, paged with ?cursor=<next_cursor>&limit=<n>"""
+    try:
+        records, next_cursor = _soil_page(request.args)
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'records': [{
+            'id': r.id,
+            'location_id': r.location_id,
+            'location': _location_label(r),
+            'nitrogen': r.nitrogen,
+            'phosphorus': r.phosphorus,
+            'potassium': r.potassium,
+            'ph': r.ph,
+            'date_recorded': r.date_recorded.isoformat() if r.date_recorded else None
+        } for r in records],
+        'next_cursor': next_cursor
+    }), 200
 
 
 @blueprint.route('/weather')
 def weather():
-    # Query all weather data records
-    weather_records = WeatherData.query.all()
-    return render_template('weather/view_weather.html', weather_records=weather_records)
+    # One keyset page of weather records, newest first
+    try:
+        weather_records, next_cursor = _weather_page(request.args)
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+    return render_template('weather/view_weather.html', weather_records=weather_records, next_cursor=next_cursor)
+
+
+@blueprint.route('/weather/records', methods=['GET'])
+def weather_records_api():
+    """Weather records as JSON, paged with ?cursor=<next_cursor>&limit=<n>"""
+    try:
+        records, next_cursor = _weather_page(request.args)
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'records': [{
+            'id': r.id,
+            'location_id': r.location_id,
+            'location': _location_label(r),
+            'temperature': r.temperature,
+            'humidity': r.humidity,
+            'rainfall': r.rainfall,
+            'date_recorded': r.date_recorded.isoformat() if r.date_recorded else None
+        } for r in records],
+        'next_cursor': next_cursor
+    }), 200
+
+
+@blueprint.route('/upstreams', methods=['GET'])
+def upstream_status():
+    """Circuit breaker state for each external integration"""
+    return jsonify({name: breaker.status() for name, breaker in breakers.items()}), 200
 
 
 @blueprint.route('/geocode')
@@ -514,47 +625,34 @@ def get_soil_info():
     lon = geo_data.get('lon')
     display_name = geo_data.get('display_name', address)
 
-    # Check if location exists, otherwise create it
-    location = Location.query.filter_by(latitude=lat, longitude=lon).first()
-    if not location:
-        location = Location(
-            name=display_name,
-            latitude=lat,
-            longitude=lon,
-            description=f"Location for {display_name}"
-        )
-        try:
-            db.session.add(location)
-            db.session.commit()
-            logger.info(f"Created new location: {display_name}")
-        except IntegrityError:
-            db.session.rollback()
-            location = Location.query.filter_by(latitude=lat, longitude=lon).first()
-            logger.info(f"Location already exists for lat={lat}, lon={lon}")
-        except Exception as e:
-            db.session.rollback()
-            logger.error(f"Error saving location to database: {str(e)}")
-            return jsonify({'error': 'Failed to save location to database'}), 500
-
-    soil_data = fetch_soil_data(lat, lon)
-    if soil_data is None:
-        return jsonify({'error': 'Failed to fetch soil data from SoilGrids'}), 500
-
-    # Save soil data to database
-    soil_record = SoilData(
-        location_id=location.id,
-        nitrogen=soil_data['N'],
-        phosphorus=soil_data['P'],
-        potassium=soil_data['K'],
-        ph=soil_data['ph'],
-        date_recorded=datetime.utcnow()
-    )
+    # Reuse the stored location within LOCATION_MATCH_RADIUS, otherwise create it
     try:
-        db.session.add(soil_record)
-        db.session.commit()
-        logger.info(f"Saved soil data for location_id={location.id}: {soil_data}")
+        location = get_or_create_location(lat, lon, display_name)
+    except Exception as e:
+        logger.error(f"Error saving location to database: {str(e)}")
+        return jsonify({'error': 'Failed to save location to database'}), 500
+
+    # Fall back to default values (flagged as degraded) when iSDA fails or its circuit is open
+    try:
+        soil_data = request_soil_data(lat, lon)
+        degraded = False
+    except Exception as e:
+        logger.warning(f"Using fallback soil data for {display_name}: {str(e)}")
+        soil_data = dict(SOIL_FALLBACK)
+        degraded = True
+
+    # Save soil data to database (buffered, written in bulk); fallback and unchanged values are skipped
+    try:
+        if not degraded:
+            record_observation(SoilData, {
+                'location_id': location.id,
+                'nitrogen': soil_data['N'],
+                'phosphorus': soil_data['P'],
+                'potassium': soil_data['K'],
+                'ph': soil_data['ph'],
+                'date_recorded': datetime.utcnow()
+            })
     except Exception as e:
-        db.session.rollback()
         logger.error(f"Error saving soil data to database: {str(e)}")
         return jsonify({'error': 'Failed to save soil data to database'}), 500
 
@@ -564,7 +662,8 @@ def get_soil_info():
             'lat': lat,
             'lon': lon
         },
-        'soil': soil_data
+        'soil': soil_data,
+        'degraded': degraded
     }
 
     return jsonify(response_data)
@@ -585,52 +684,42 @@ def get_weather_info():
     lon = geo_data.get('lon')
     display_name = geo_data.get('display_name', city)
 
-    # Check if location exists, otherwise create it
-    location = Location.query.filter_by(latitude=lat, longitude=lon).first()
-    if not location:
-        location = Location(
-            name=display_name,
-            latitude=lat,
-            longitude=lon,
-            description=f"Location for {display_name}"
-        )
-        try:
-            db.session.add(location)
-            db.session.commit()
-            logger.info(f"Created new location: {display_name}")
-        except IntegrityError:
-            db.session.rollback()
-            location = Location.query.filter_by(latitude=lat, longitude=lon).first()
-            logger.info(f"Location already exists for lat={lat}, lon={lon}")
-        except Exception as e:
-            db.session.rollback()
-            logger.error(f"Error saving location to database: {str(e)}")
-            return jsonify({'error': 'Failed to save location to database'}), 500
-
-    weather = fetch_weather_data(city)
-    if all(value is None for value in weather.values()):
-        return jsonify({"error": "Failed to fetch weather data"}), 500
-
-    # Save weather data to database
-    weather_record = WeatherData(
-        location_id=location.id,
-        temperature=weather['temperature'],
-        humidity=weather['humidity'],
-        rainfall=weather['rainfall'],
-        date_recorded=datetime.utcnow()
-    )
+    # Reuse the stored location within LOCATION_MATCH_RADIUS, otherwise create it
     try:
-        db.session.add(weather_record)
-        db.session.commit()
-        logger.info(f"Saved weather data for location_id={location.id}: {weather}")
+        location = get_or_create_location(lat, lon, display_name)
+    except Exception as e:
+        logger.error(f"Error saving location to database: {str(e)}")
+        return jsonify({'error': 'Failed to save location to database'}), 500
+
+    # Fall back to default values (flagged as degraded) when WeatherAPI fails or its circuit is open
+    try:
+        weather, weather_meta = lookup_weather(city)
+        link_weather_query(coordinate_query(location.latitude, location.longitude), weather_meta['location_key'])
+        degraded = False
+    except Exception as e:
+        logger.warning(f"Using fallback weather data for {city}: {str(e)}")
+        weather, weather_meta = dict(WEATHER_FALLBACK), {'cache': None}
+        degraded = True
+
+    # Save weather data to database (buffered, written in bulk); fallback and unchanged values are skipped
+    try:
+        if not degraded:
+            record_observation(WeatherData, {
+                'location_id': location.id,
+                'temperature': weather['temperature'],
+                'humidity': weather['humidity'],
+                'rainfall': weather['rainfall'],
+                'date_recorded': datetime.utcnow()
+            })
     except Exception as e:
-        db.session.rollback()
         logger.error(f"Error saving weather data to database: {str(e)}")
         return jsonify({'error': 'Failed to save weather data to database'}), 500
 
     return jsonify({
         "city": city,
-        "weather": weather
+        "weather": weather,
+        "degraded": degraded,
+        "cache": weather_meta
     })
 
 
@@ -640,89 +729,21 @@ def model_input():
     if not location_name:
         return jsonify({'error': 'Location parameter is required'}), 400
 
-    # Get geolocation for location
-    geo_data = get_lat_lon(location_name)
-    if not geo_data or 'lat' not in geo_data or 'lon' not in geo_data:
-        return jsonify({'error': 'Failed to get geolocation data'}), 500
-
-    lat = geo_data.get('lat')
-    lon = geo_data.get('lon')
-    display_name = geo_data.get('display_name', location_name)
-
-    # Check if location exists, otherwise create it
-    location = Location.query.filter_by(latitude=lat, longitude=lon).first()
-    if not location:
-        location = Location(
-            name=display_name,
-            latitude=lat,
-            longitude=lon,
-            description=f"Location for {display_name}"
-        )
-        try:
-            db.session.add(location)
-            db.session.commit()
-            logger.info(f"Created new location: {display_name}")
-        except IntegrityError:
-            db.session.rollback()
-            location = Location.query.filter_by(latitude=lat, longitude=lon).first()
-            logger.info(f"Location already exists for lat={lat}, lon={lon}")
-        except Exception as e:
-            db.session.rollback()
-            logger.error(f"Error saving location to database: {str(e)}")
-            return jsonify({'error': 'Failed to save location to database'}), 500
-
-    # Fetch soil and weather data
-    soil_data = fetch_soil_data(lat, lon)
-    weather_data = fetch_weather_data(location_name)
-
-    if soil_data is None or all(value is None for value in weather_data.values()):
-        return jsonify({'error': 'Failed to fetch complete model input features'}), 500
-
-    # Save soil data to database
-    soil_record = SoilData(
-        location_id=location.id,
-        nitrogen=soil_data['N'],
-        phosphorus=soil_data['P'],
-        potassium=soil_data['K'],
-        ph=soil_data['ph'],
-        date_recorded=datetime.utcnow()
-    )
+    # Geocode, fetch soil and weather once each, and persist them
+    assembler = FeatureAssembler(location_name)
     try:
-        db.session.add(soil_record)
-        db.session.commit()
-        logger.info(f"Saved soil data for location_id={location.id}: {soil_data}")
-    except Exception as e:
-        db.session.rollback()
-        logger.error(f"Error saving soil data to database: {str(e)}")
-        # Continue to allow prediction even if soil save fails
-
-    # Save weather data to database
-    weather_record = WeatherData(
-        location_id=location.id,
-        temperature=weather_data['temperature'],
-        humidity=weather_data['humidity'],
-        rainfall=weather_data['rainfall'],
-        date_recorded=datetime.utcnow()
-    )
-    try:
-        db.session.add(weather_record)
-        db.session.commit()
-        logger.info(f"Saved weather data for location_id={location.id}: {weather_data}")
-    except Exception as e:
-        db.session.rollback()
-        logger.error(f"Error saving weather data to database: {str(e)}")
-        # Continue to allow prediction even if weather save fails
-
-    features = get_model_input_features(location_name)
-    if not features:
-        return jsonify({'error': 'Failed to fetch complete model input features'}), 500
+        features = assembler.assemble()
+    except FeatureAssemblyError as e:
+        return jsonify({'error': str(e), 'pipeline': assembler.report()}), 500
 
     # IMPORTANT: return raw features (do NOT standardize / clamp values here)
     return jsonify({
         'location': location_name,
-        'location_id': location.id,
+        'location_id': assembler.location.id,
+        'location_name': assembler.location.name,
         'features': features,
-        'original_features': features
+        'original_features': features,
+        'pipeline': assembler.report()
     }), 200
 
 
@@ -762,163 +783,273 @@ def predict():
         location_id = data.get('location_id')
         location_name = data.get('location')
 
-        required_features = ['n', 'p', 'k', 'ph', 'temperature', 'humidity', 'rainfall']
-
-        # lowercase keys
-        features = {k.lower(): v for k, v in features.items()}
-
-        if not all(k in features for k in required_features):
-            missing = [k for k in required_features if k not in features]
-            return jsonify({'error': f'Missing required features: {missing}'}), 400
+        try:
+            features = normalize_features(features)
+        except ValueError as ve:
+            return jsonify({'error': str(ve)}), 400
 
         if not location_id or not location_name:
             return jsonify({'error': 'Location ID and name are required'}), 400
 
-        # === BUILD INPUT FOR MODEL ===
-        input_map = {
-            'N': float(features['n']),
-            'P': float(features['p']),
-            'K': float(features['k']),
+        # --- MODEL PREDICTION + HYBRID RULES ---
+        predictions = score_batch(model, hybrid_rules.current(), [features])[0]['predictions']
+
+        # The insert is written behind, so check the foreign key now rather than fail later
+        if db.session.get(Location, location_id) is None:
+            return jsonify({'error': f'Unknown location_id: {location_id}'}), 400
+
+        # Save prediction
+        write_behind.enqueue(Prediction, {
+            'location_id': location_id,
+            'user_id': current_user.id if current_user.is_authenticated else None,
+            'nitrogen': float(features['n']),
+            'phosphorus': float(features['p']),
+            'potassium': float(features['k']),
+            'ph': float(features['ph']),
             'temperature': float(features['temperature']),
             'humidity': float(features['humidity']),
-            'ph': float(features['ph']),
             'rainfall': float(features['rainfall']),
-        }
+            'crop_recommended': predictions[0]["crop"],
+            'is_suitable': True,
+            'confidence_score': predictions[0]["probability"],
+            'timestamp': datetime.utcnow()
+        })
 
-        try:
-            model_cols = list(model.feature_names_in_)
-        except:
-            model_cols = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+        # Queue Grok actionable insights; clients fetch them from /data/insights/<job_id>
+        insight_job_id = submit_insight_job(
+            soil_data={
+                'n': float(features['n']),
+                'p': float(features['p']),
+                'k': float(features['k']),
+                'ph': float(features['ph'])
+            },
+            weather_data={
+                'temperature': float(features['temperature']),
+                'humidity': float(features['humidity']),
+                'rainfall': float(features['rainfall'])
+            },
+            crop=predictions[0]["crop"],
+            location_name=location_name,
+            location_id=location_id
+        )
+
+        return jsonify({
+            'predictions': predictions,
+            'suitability': None,
+            'openai_recommendation': None,
+            'grok_recommendation': None,
+            'insight_job_id': insight_job_id
+        }), 200
 
-        input_df = pd.DataFrame([input_map])[model_cols]
-        feature_array = input_df.to_numpy()
+    except Exception as e:
+        logger.error(f"Prediction error: {str(e)}. Input features: {features}")
+        return jsonify({'error': f'Prediction error: {str(e)}'}), 500
 
-        # --- MODEL PREDICTION ---
-        probabilities = model.predict_proba(feature_array)[0]
-        model_classes = model.classes_
-        predicted_label = model.predict(feature_array)[0]
 
-        # Decode label
-        if isinstance(predicted_label, (int, np.integer)):
-            predicted_crop = label_encoder.inverse_transform([predicted_label])[0]
+# Seconds an SSE client is held open waiting for an insight job
+INSIGHT_STREAM_TIMEOUT = 60
+INSIGHT_STREAM_KEEPALIVE = 15
+# Milliseconds an EventSource waits before reconnecting when the stream is not held open
+INSIGHT_STREAM_RETRY_MS = 2000
+# Set when gunicorn runs an async worker class (gevent/eventlet), which can hold streams cheaply
+INSIGHT_STREAM_ASYNC = os.getenv("INSIGHT_STREAM_ASYNC", "False") == "True"
+
+
+def _can_hold_stream() -> bool:
+    # A sync worker serves one request at a time, so an open stream would block it
+    return bool(request.environ.get('wsgi.multithread')) or INSIGHT_STREAM_ASYNC
+
+
+@blueprint.route('/insights/<job_id>', methods=['GET'])
+def get_insights(job_id):
+    """Poll the status of a background Grok insight job"""
+    job = get_insight_job(job_id)
+    if not job:
+        return jsonify({'error': 'Insight job not found or expired'}), 404
+    return jsonify(job), 200
+
+
+@blueprint.route('/insights/<job_id>/stream', methods=['GET'])
+def stream_insights(job_id):
+    """
+    Server-Sent Events stream that emits the insight job once it finishes.
+    On sync workers the current state is sent once with a retry hint instead
+    of holding the worker, and the EventSource reconnects to check again.
+    """
+    job = get_insight_job(job_id)
+    if not job:
+        return jsonify({'error': 'Insight job not found or expired'}), 404
+
+    def generate():
+        waited = 0
+        while waited < INSIGHT_STREAM_TIMEOUT:
+            job = wait_for_insight_job(job_id, INSIGHT_STREAM_KEEPALIVE)
+            waited += INSIGHT_STREAM_KEEPALIVE
+            if not job:
+                break
+            if job['status'] != 'pending':
+                yield f"event: insight\ndata: {json.dumps(job)}\n\n"
+                return
+            yield ": keep-alive\n\n"
+        yield f"event: timeout\ndata: {json.dumps({'job_id': job_id})}\n\n"
+
+    def snapshot():
+        if job['status'] != 'pending':
+            yield f"event: insight\ndata: {json.dumps(job)}\n\n"
         else:
-            predicted_crop = str(predicted_label)
-
-        # ----------------------------------------------------------
-        # 🔥 HYBRID SMART-KENYA RULE ENGINE (Option 1 fix)
-        # ----------------------------------------------------------
-        corrected_scores = {}
-        temp = float(features["temperature"])
-        rainfall = float(features["rainfall"])
-        humidity = float(features["humidity"])
-        ph = float(features["ph"])
-
-        for idx, label in enumerate(model_classes):
-
-            # decode each crop
-            if isinstance(label, (int, np.integer)):
-                crop_name = label_encoder.inverse_transform([label])[0]
-            else:
-                crop_name = str(label)
-
-            prob = float(probabilities[idx])
-            suitability = 1.0
-
-            # RULE 1 — Penalize apples everywhere
-            if crop_name.lower() == "apple":
-                prob *= 0.15
-
-            # RULE 2 — High temperature areas
-            if temp > 22:
-                if crop_name.lower() in ["banana", "mango", "cassava", "pineapple", "papaya", "sugarcane"]:
-                    suitability += 0.35
-                if crop_name.lower() in ["maize", "sorghum", "millet"]:
-                    suitability += 0.15
-
-            # RULE 3 — Cold areas
-            if temp < 18:
-                if crop_name.lower() in ["tea", "potatoes", "cabbage", "peas"]:
-                    suitability += 0.40
-                if crop_name.lower() in ["wheat", "barley"]:
-                    suitability += 0.25
-
-            # RULE 4 — Low rainfall
-            if rainfall < 5:
-                if crop_name.lower() in ["sorghum", "millet", "pigeon pea", "cowpeas"]:
-                    suitability += 0.40
-
-            # RULE 5 — High rainfall
-            if rainfall > 15:
-                if crop_name.lower() in ["rice", "sugarcane"]:
-                    suitability += 0.30
-
-            # RULE 6 — Acidic soils
-            if ph < 6:
-                if crop_name.lower() in ["tea", "potatoes"]:
-                    suitability += 0.25
-                if crop_name.lower() in ["maize"]:
-                    suitability += 0.10
-
-            # HYBRID SCORE: 70% ML + 30% Rules
-            final_score = (0.7 * prob) + (0.3 * suitability)
-            corrected_scores[crop_name] = final_score
-
-        # Sorted top-4 final recommendations
-        sorted_crops = sorted(corrected_scores.items(), key=lambda x: x[1], reverse=True)
-        predictions = [
-            {"crop": crop, "probability": float(score)}
-            for crop, score in sorted_crops[:4]
-        ]
+            yield f"retry: {INSIGHT_STREAM_RETRY_MS}\nevent: pending\ndata: {json.dumps(job)}\n\n"
 
-        # Save prediction
-        prediction_record = Prediction(
-            location_id=location_id,
-            user_id=current_user.id if current_user.is_authenticated else None,
-            nitrogen=float(features['n']),
-            phosphorus=float(features['p']),
-            potassium=float(features['k']),
-            ph=float(features['ph']),
-            temperature=float(features['temperature']),
-            humidity=float(features['humidity']),
-            rainfall=float(features['rainfall']),
-            crop_recommended=predictions[0]["crop"],
-            is_suitable=True,
-            confidence_score=predictions[0]["probability"],
-        )
-        db.session.add(prediction_record)
-        db.session.commit()
+    return Response(
+        stream_with_context(generate()) if _can_hold_stream() else snapshot(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+MAX_BATCH_ROWS = 1000
+
+
+@blueprint.route('/predict/batch', methods=['POST'])
+@csrf.exempt
+def predict_batch():
+    """Score many feature rows in one predict_proba call and return per-row top-4 crops"""
+    if not model or not label_encoder:
+        return jsonify({'error': 'Model or label encoder not loaded'}), 500
 
-        # Fetch Grok actionable insights
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('rows'), list) or not data['rows']:
+        return jsonify({'error': 'JSON body with a non-empty "rows" list is required'}), 400
+
+    rows = data['rows']
+    if len(rows) > MAX_BATCH_ROWS:
+        return jsonify({'error': f'At most {MAX_BATCH_ROWS} rows are allowed per batch'}), 400
+
+    feature_rows = []
+    for idx, row in enumerate(rows):
+        if not isinstance(row, dict):
+            return jsonify({'error': f'Row {idx} must be an object'}), 400
+        if not row.get('location_id'):
+            return jsonify({'error': f'Row {idx}: location_id is required'}), 400
+        if not isinstance(row['location_id'], int) or isinstance(row['location_id'], bool):
+            return jsonify({'error': f'Row {idx}: location_id must be an integer'}), 400
         try:
-            grok_recommendation = get_grok_crop_recommendation(
-                soil_data={
-                    'n': float(features['n']),
-                    'p': float(features['p']),
-                    'k': float(features['k']),
-                    'ph': float(features['ph'])
-                },
-                weather_data={
-                    'temperature': float(features['temperature']),
-                    'humidity': float(features['humidity']),
-                    'rainfall': float(features['rainfall'])
-                },
-                crop=predictions[0]["crop"],
-                location_name=location_name
-            )
-        except Exception as grok_e:
-            logger.error(f"Grok recommendation error: {str(grok_e)}")
-            grok_recommendation = "Failed to fetch actionable insights from Grok API."
+            feature_rows.append(normalize_features(row.get('features', row)))
+        except (ValueError, TypeError) as ve:
+            return jsonify({'error': f'Row {idx}: {str(ve)}'}), 400
+
+    try:
+        results = score_batch(model, hybrid_rules.current(), feature_rows)
+
+        # The inserts are written behind, so check the foreign keys now rather than fail later
+        location_ids = {row['location_id'] for row in rows}
+        known_ids = {
+            location_id for (location_id,) in
+            db.session.query(Location.id).filter(Location.id.in_(location_ids)).all()
+        }
+        unknown_ids = location_ids - known_ids
+        if unknown_ids:
+            return jsonify({'error': f'Unknown location_id: {sorted(unknown_ids, key=str)}'}), 400
+
+        user_id = current_user.id if current_user.is_authenticated else None
+        now = datetime.utcnow()
+        write_behind.enqueue(Prediction, [
+            {
+                'location_id': row['location_id'],
+                'user_id': user_id,
+                'nitrogen': features['n'],
+                'phosphorus': features['p'],
+                'potassium': features['k'],
+                'ph': features['ph'],
+                'temperature': features['temperature'],
+                'humidity': features['humidity'],
+                'rainfall': features['rainfall'],
+                'crop_recommended': result['predictions'][0]['crop'],
+                'is_suitable': True,
+                'confidence_score': result['predictions'][0]['probability'],
+                'timestamp': now
+            }
+            for row, features, result in zip(rows, feature_rows, results)
+        ])
 
         return jsonify({
-            'predictions': predictions,
-            'suitability': None,
-            'openai_recommendation': None,
-            'grok_recommendation': grok_recommendation
+            'count': len(results),
+            'results': [
+                {
+                    'index': idx,
+                    'location_id': row['location_id'],
+                    'location': row.get('location'),
+                    'ml_prediction': result['ml_prediction'],
+                    'predictions': result['predictions']
+                }
+                for idx, (row, result) in enumerate(zip(rows, results))
+            ]
         }), 200
 
     except Exception as e:
-        logger.error(f"Prediction error: {str(e)}. Input features: {features}")
-        return jsonify({'error': f'Prediction error: {str(e)}'}), 500
+        db.session.rollback()
+        logger.error(f"Batch prediction error: {str(e)}")
+        return jsonify({'error': f'Batch prediction error: {str(e)}'}), 500
+
 
+LOCAL_ADDRESSES = ('127.0.0.1', '::1', 'localhost')
 
 
+def _is_local_request():
+    return request.remote_addr in LOCAL_ADDRESSES
+
+
+@blueprint.route('/rules', methods=['GET'])
+def get_rules():
+    """Show the active hybrid ruleset and its compiled crop -> condition index (local only)"""
+    if not _is_local_request():
+        return jsonify({'error': 'Rules endpoints are only available locally'}), 403
+    if not hybrid_rules:
+        return jsonify({'error': 'Model or label encoder not loaded'}), 500
+
+    compiled = hybrid_rules.current()
+    return jsonify({
+        'path': hybrid_rules.path,
+        'rules': hybrid_rules.rules,
+        'index': compiled.index()
+    }), 200
+
+
+@blueprint.route('/rules/reload', methods=['POST'])
+@csrf.exempt
+def reload_rules():
+    """Force a reload of the hybrid rule file without restarting the app (local only)"""
+    if not _is_local_request():
+        return jsonify({'error': 'Rules endpoints are only available locally'}), 403
+    if not hybrid_rules:
+        return jsonify({'error': 'Model or label encoder not loaded'}), 500
+
+    reloaded = hybrid_rules.reload(force=True)
+    if not reloaded:
+        return jsonify({'error': 'Rule file is invalid, previous ruleset kept active'}), 400
+    return jsonify({'reloaded': True, 'conditions': hybrid_rules.current().condition_names}), 200
+
+
+@blueprint.route('/rules/score', methods=['POST'])
+@csrf.exempt
+def score_rules():
+    """Score one feature vector against the active ruleset and an optional candidate ruleset (local only)"""
+    if not _is_local_request():
+        return jsonify({'error': 'Rules endpoints are only available locally'}), 403
+    if not model or not hybrid_rules:
+        return jsonify({'error': 'Model or label encoder not loaded'}), 500
+
+    data = request.get_json(silent=True)
+    if not data or 'features' not in data:
+        return jsonify({'error': 'JSON body with "features" is required'}), 400
+
+    try:
+        feature_rows = [normalize_features(data['features'])]
+        candidate = hybrid_rules.candidate(data['rules']) if data.get('rules') else None
+    except (ValueError, TypeError, KeyError) as ve:
+        return jsonify({'error': str(ve)}), 400
+
+    probability_matrix = model.predict_proba(build_feature_matrix(model, feature_rows))
+    response = {'active': score_probabilities(probability_matrix, hybrid_rules.current(), feature_rows)[0]}
+    if candidate:
+        response['candidate'] = score_probabilities(probability_matrix, candidate, feature_rows)[0]
+    return jsonify(response), 200
@@ -0,0 +1,72 @@
+import copy
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one.
+
+    The first caller for a key runs the function; callers arriving with the
+    same key while it is in flight wait for it and get the same result (or
+    the same exception) instead of making their own upstream request. Once
+    the call finishes the key is forgotten, so later callers run it again
+    (and hit whatever cache the function itself consults). A waiter given a
+    timeout gets TimeoutError if the call is still running by then, so a
+    hung leader cannot hold coalesced callers past their own deadlines.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+
+        if not leader:
+            if not call.done.wait(None if timeout is None else max(0.0, timeout)):
+                raise TimeoutError(f"{self.name}: in-flight lookup for {key!r} did not finish within {timeout}s")
+            if call.error is not None:
+                raise call.error
+            # Each caller gets its own copy, since callers annotate the result dicts
+            return copy.copy(call.result)
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return copy.copy(call.result)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.info(f"{self.name}: {call.waiters} duplicate in-flight lookups shared one request")
+            call.done.set()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+geocode_flight = SingleFlight('geocode')
+soil_flight = SingleFlight('soil')
+weather_flight = SingleFlight('weather')
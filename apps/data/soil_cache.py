@@ -0,0 +1,144 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# On-disk soil cache shared by all workers on this host
+SOIL_CACHE_PATH = os.getenv("SOIL_CACHE_PATH", "soil_cache.db")
+# Grid cell size in degrees; 0.00027° is roughly iSDAsoil's 30 m resolution
+SOIL_CACHE_GRID_DEGREES = float(os.getenv("SOIL_CACHE_GRID_DEGREES", "0.00027"))
+# How many neighbouring cells to search around the query cell
+SOIL_CACHE_SEARCH_CELLS = int(os.getenv("SOIL_CACHE_SEARCH_CELLS", "1"))
+# Entries older than this (seconds) are refetched; soil changes slowly
+SOIL_CACHE_TTL = int(os.getenv("SOIL_CACHE_TTL", str(90 * 24 * 3600)))
+# Legacy whole-file JSON cache, imported once when the store is created
+LEGACY_CACHE_FILE = "soil_data_cache.json"
+
+_FALLBACK_VALUES = {"N": 100.0, "P": 30.0, "K": 300.0, "ph": 6.5}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS soil_cache (
+    lat_cell INTEGER NOT NULL,
+    lon_cell INTEGER NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    n REAL NOT NULL,
+    p REAL NOT NULL,
+    k REAL NOT NULL,
+    ph REAL NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (lat_cell, lon_cell)
+) WITHOUT ROWID
+"""
+
+
+class SoilCache:
+    """
+    Soil nutrients cached per grid cell in a local SQLite file.
+
+    Coordinates snap to a grid of grid_degrees cells; a lookup returns the
+    nearest cached cell within search_cells of the query cell. SQLite in
+    WAL mode gives atomic single-row writes that are safe across gunicorn
+    workers, so no process ever rewrites the whole cache.
+    """
+
+    def __init__(self, path: str = SOIL_CACHE_PATH, grid_degrees: float = SOIL_CACHE_GRID_DEGREES,
+                 search_cells: int = SOIL_CACHE_SEARCH_CELLS, ttl: int = SOIL_CACHE_TTL):
+        self.path = path
+        self.grid_degrees = grid_degrees
+        self.search_cells = search_cells
+        self.ttl = ttl
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    created = conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='soil_cache'"
+                    ).fetchone() is None
+                    conn.execute(_SCHEMA)
+                    if created:
+                        self._import_legacy(conn)
+                    self._initialized = True
+        return conn
+
+    def _cell(self, lat: float, lon: float):
+        return math.floor(lat / self.grid_degrees), math.floor(lon / self.grid_degrees)
+
+    def get(self, lat: float, lon: float) -> Optional[Dict[str, float]]:
+        lat_cell, lon_cell = self._cell(lat, lon)
+        r = self.search_cells
+        row = self._connect().execute(
+            """
+            SELECT n, p, k, ph FROM soil_cache
+            WHERE lat_cell BETWEEN ? AND ? AND lon_cell BETWEEN ? AND ? AND fetched_at >= ?
+            ORDER BY (lat_cell - ?) * (lat_cell - ?) + (lon_cell - ?) * (lon_cell - ?)
+            LIMIT 1
+            """,
+            (lat_cell - r, lat_cell + r, lon_cell - r, lon_cell + r, time.time() - self.ttl,
+             lat_cell, lat_cell, lon_cell, lon_cell)
+        ).fetchone()
+        if not row:
+            return None
+        return {"N": row[0], "P": row[1], "K": row[2], "ph": row[3]}
+
+    def fetched_at(self, lat: float, lon: float) -> Optional[float]:
+        """When the cell get() would answer from was fetched, or None if nothing is cached."""
+        lat_cell, lon_cell = self._cell(lat, lon)
+        r = self.search_cells
+        row = self._connect().execute(
+            """
+            SELECT fetched_at FROM soil_cache
+            WHERE lat_cell BETWEEN ? AND ? AND lon_cell BETWEEN ? AND ? AND fetched_at >= ?
+            ORDER BY (lat_cell - ?) * (lat_cell - ?) + (lon_cell - ?) * (lon_cell - ?)
+            LIMIT 1
+            """,
+            (lat_cell - r, lat_cell + r, lon_cell - r, lon_cell + r, time.time() - self.ttl,
+             lat_cell, lat_cell, lon_cell, lon_cell)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, lat: float, lon: float, soil: Dict[str, float], fetched_at: Optional[float] = None) -> None:
+        lat_cell, lon_cell = self._cell(lat, lon)
+        self._connect().execute(
+            "INSERT OR REPLACE INTO soil_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (lat_cell, lon_cell, lat, lon, soil["N"], soil["P"], soil["K"], soil["ph"],
+             fetched_at if fetched_at is not None else time.time())
+        )
+
+    def _import_legacy(self, conn: sqlite3.Connection) -> None:
+        if not os.path.exists(LEGACY_CACHE_FILE):
+            return
+        try:
+            with open(LEGACY_CACHE_FILE, 'r') as f:
+                legacy = json.load(f)
+            rows = []
+            now = time.time()
+            for key, soil in legacy.items():
+                # Entries equal to the fallback defaults were never real iSDA readings
+                if soil == _FALLBACK_VALUES:
+                    continue
+                lat, lon = (float(v) for v in key.split(','))
+                rows.append((*self._cell(lat, lon), lat, lon, soil["N"], soil["P"], soil["K"], soil["ph"], now))
+            conn.executemany("INSERT OR REPLACE INTO soil_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            logger.info(f"Imported {len(rows)} entries from {LEGACY_CACHE_FILE} into the soil cache")
+        except Exception as e:
+            logger.error(f"Could not import legacy soil cache {LEGACY_CACHE_FILE}: {str(e)}")
+
+
+soil_cache = SoilCache()
@@ -2,11 +2,21 @@ import os
 import requests
 import time
 import logging
-from typing import Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 import json
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from apps.data.isda_client import get_isda_client
+from apps.data.soil_cache import soil_cache
+from apps.data.geocode_cache import get_cached_geocode, store_geocode, normalize_address
+from apps.data.cache import MISSING
+from apps.data.http_client import get_session, upstream_timeout
+from apps.data.circuit import breakers, CircuitOpenError
+from apps.data.weather_cache import get_cached_weather, store_weather, resolved_location_key
+from apps.data.singleflight import geocode_flight, soil_flight, weather_flight
+from apps.data.ratelimit import nominatim_limiter, RateLimitExceeded, NOMINATIM_MAX_WAIT
+
 
 load_dotenv()  # <-- ensure environment variables are loaded
 
@@ -16,25 +26,56 @@ logger = logging.getLogger(__name__)
 
 # WeatherAPI key
 WEATHERAPI_KEY = os.getenv("WEATHERAPI_KEY", "a8f656b81fb548bf82c125713251705")
-# Cache file for soil data
-CACHE_FILE = "soil_data_cache.json"
 
 # iSDAsoil API credentials
 ISDA_API_USERNAME = os.getenv("ISDA_API_USERNAME", "YOUR_EMAIL")
 ISDA_API_PASSWORD = os.getenv("ISDA_API_PASSWORD", "YOUR_PASSWORD")
 ISDA_API_BASE_URL = "http://test-api.isda-africa.com/isdasoil/v2"
 
+# Defaults used when an upstream is unavailable
+SOIL_FALLBACK = {"N": 100.0, "P": 30.0, "K": 300.0, "ph": 6.5}
+WEATHER_FALLBACK = {
+    "temperature": 25.0,  # °C
+    "humidity": 60.0,     # %
+    "rainfall": 100.0     # mm
+}
+
 # Grok  API key
 #GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GROK_API_KEY = os.getenv("GROK_API_KEY")
 
 
 
-def get_lat_lon(address: str, retries: int = 3, delay: int = 2, timeout: int = 15) -> Optional[Dict[str, any]]:
+def get_lat_lon(address: str, retries: int = 3, delay: int = 2, timeout: int = 15,
+                max_wait: float = NOMINATIM_MAX_WAIT) -> Optional[Dict[str, any]]:
     """
     Fetch latitude and longitude for a given address using Nominatim with retries.
+    Answers (including "no result") are served from the geocode cache when possible.
+    Outbound requests go through the shared Nominatim rate limiter; if no slot
+    is free within max_wait seconds the lookup fails fast and returns None.
+    Concurrent lookups of the same (normalized) address share one request;
+    a caller waiting on another's lookup gives up after max_wait plus one
+    request timeout and returns None.
     """
-    address_lower = address.lower().strip()
+    try:
+        return geocode_flight.do(
+            normalize_address(address), _get_lat_lon, address, retries, delay, timeout, max_wait,
+            timeout=max_wait + timeout
+        )
+    except TimeoutError as e:
+        logger.warning(f"Geocoding for {address} skipped: {str(e)}")
+        return None
+
+
+def _get_lat_lon(address: str, retries: int, delay: int, timeout: int,
+                 max_wait: float) -> Optional[Dict[str, any]]:
+    cached = get_cached_geocode(address)
+    if cached is not MISSING:
+        logger.info(f"Geocode cache hit for {address}: {cached}")
+        if cached:
+            cached['name'] = address  # Include original address for location storage
+        return cached
+
     url = "https://nominatim.openstreetmap.org/search"
     params = {
         'q': address,
@@ -45,9 +86,19 @@ def get_lat_lon(address: str, retries: int = 3, delay: int = 2, timeout: int = 1
         'User-Agent': 'SmartFarmApp/1.0 (muhammadhamdun19@gmail.com)'
     }
 
+    answered_empty = False
+    deadline = time.monotonic() + max_wait
     for attempt in range(1, retries + 1):
         try:
-            response = requests.get(url, params=params, headers=headers, timeout=timeout)
+            nominatim_limiter.acquire(max(0.0, deadline - time.monotonic()))
+        except RateLimitExceeded as e:
+            logger.warning(f"Geocoding for {address} skipped, Nominatim rate limit queue is full: {str(e)}")
+            return None
+
+        try:
+            response = get_session('nominatim').get(
+                url, params=params, headers=headers, timeout=(upstream_timeout('nominatim')[0], timeout)
+            )
             response.raise_for_status()
             results = response.json()
             if results:
@@ -58,21 +109,60 @@ def get_lat_lon(address: str, retries: int = 3, delay: int = 2, timeout: int = 1
                     'name': address  # Include original address for location storage
                 }
                 logger.info(f"Fetched coordinates for {address}: {result}")
+                store_geocode(address, result)
                 return result
+            answered_empty = True
             logger.warning(f"No geocoding result for address: {address} (attempt {attempt}/{retries})")
         except requests.exceptions.RequestException as e:
             logger.error(f"Geocoding error for {address} (attempt {attempt}/{retries}): {str(e)}")
             if attempt < retries:
+                if time.monotonic() + delay >= deadline:
+                    break
                 logger.info(f"Retrying in {delay} seconds...")
                 time.sleep(delay)
 
+    # Only cache a miss Nominatim actually answered, never a network failure
+    if answered_empty:
+        store_geocode(address, None)
     logger.error(f"Failed to fetch coordinates for {address} after {retries} attempts")
     return None
 
-def fetch_weather_data(city_name: str) -> Dict[str, Optional[float]]:
+def lookup_weather(city_name: str, refresh: bool = False) -> Tuple[Dict[str, float], Dict[str, Any]]:
+    """
+    Weather for a city plus cache metadata ({'cache': 'hit'|'miss',
+    'location_key', 'fetched_at', 'last_updated', 'expires_at'}). Answers
+    are cached per resolved location until WEATHER_CACHE_TTL after
+    WeatherAPI's last_updated time; pass refresh=True to bypass the cache.
+    Raises on failure.
+    """
+    entry = None if refresh else get_cached_weather(city_name)
+    cache_status = 'hit'
+    if entry is None:
+        # Concurrent misses for the same city share one upstream call, waiting no longer than our own would take
+        entry = weather_flight.do(normalize_address(city_name), _request_weather_data, city_name,
+                                  timeout=sum(upstream_timeout('weatherapi')))
+        cache_status = 'miss'
+    else:
+        logger.info(f"Weather cache hit for {city_name}")
+    meta = {
+        'cache': cache_status,
+        'location_key': entry['location_key'],
+        'fetched_at': entry['fetched_at'],
+        'last_updated': entry['last_updated'],
+        'expires_at': entry['expires_at']
+    }
+    return dict(entry['weather']), meta
+
+
+def request_weather_data(city_name: str) -> Dict[str, float]:
     """
     Fetch weather data (temperature, humidity, rainfall) from WeatherAPI.
+    Raises on failure; see fetch_weather_data for the fallback variant.
     """
+    return lookup_weather(city_name)[0]
+
+
+def _request_weather_data(city_name: str) -> Dict[str, Any]:
     url = "http://api.weatherapi.com/v1/forecast.json"
     params = {
         "key": WEATHERAPI_KEY,
@@ -82,76 +172,85 @@ def fetch_weather_data(city_name: str) -> Dict[str, Optional[float]]:
         "alerts": "no"
     }
 
-    try:
-        response = requests.get(url, params=params, timeout=10)
+    def call():
+        response = get_session('weatherapi').get(url, params=params, timeout=upstream_timeout('weatherapi'))
         response.raise_for_status()
-        data = response.json()
+        return response.json()
 
-        current = data['current']
-        forecast = data['forecast']['forecastday'][0]['day']
+    # Raises CircuitOpenError right away while WeatherAPI is known to be down
+    data = breakers['weatherapi'].call(call)
 
-        weather = {
-            "temperature": float(current['temp_c']),  # °C
-            "humidity": float(current['humidity']),   # %
-            "rainfall": float(forecast.get('totalprecip_mm', 0.0))  # mm
-        }
-        logger.info(f"Fetched weather data for {city_name}: {weather}")
-        return weather
+    current = data['current']
+    forecast = data['forecast']['forecastday'][0]['day']
 
-    except Exception as e:
-        logger.error(f"Error fetching weather data for {city_name}: {str(e)}")
-        return {
-            "temperature": 25.0,  # °C
-            "humidity": 60.0,     # %
-            "rainfall": 100.0     # mm
-        }
+    weather = {
+        "temperature": float(current['temp_c']),  # °C
+        "humidity": float(current['humidity']),   # %
+        "rainfall": float(forecast.get('totalprecip_mm', 0.0))  # mm
+    }
+    logger.info(f"Fetched weather data for {city_name}: {weather}")
 
-def load_cache() -> Dict:
-    """Load cached soil data from file."""
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    location = data.get('location') or {}
+    try:
+        location_key = resolved_location_key(location)
+    except (KeyError, TypeError, ValueError):
+        location_key = normalize_address(city_name)
+    return store_weather(city_name, location_key, weather, current.get('last_updated_epoch'))
 
-def save_cache(cache: Dict) -> None:
-    """Save soil data to cache file."""
-    with open(CACHE_FILE, 'w') as f:
-        json.dump(cache, f)
 
-def get_isda_token() -> str | None:
+def fetch_weather_data(city_name: str) -> Dict[str, Optional[float]]:
     """
-    Authenticate with iSDAsoil production API and return a JWT token.
+    Fetch weather data (temperature, humidity, rainfall) from WeatherAPI.
     """
-    url = "https://api.isda-africa.com/login"
-    data = {
-        "grant_type": "password",
-        "username": ISDA_API_USERNAME,
-        "password": ISDA_API_PASSWORD,
-        "scope": "",
-        "client_id": "string",
-        "client_secret": "string"
-    }
-    headers = {
-        "accept": "application/json",
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
+    try:
+        return request_weather_data(city_name)
+    except Exception as e:
+        logger.error(f"Error fetching weather data for {city_name}: {str(e)}")
+        return dict(WEATHER_FALLBACK)
 
+def get_isda_token() -> str | None:
+    """
+    Return the shared iSDAsoil API token, logging in only when it needs refreshing.
+    """
     try:
-        response = requests.post(url, data=data, headers=headers, timeout=10)
-        response.raise_for_status()
-        token = response.json().get("access_token")
-        if token:
-            logger.info("✅ Successfully obtained iSDAsoil API token")
-            return token
-        else:
-            logger.error("❌ No token in response")
-            return None
+        return get_isda_client().get_token()
     except Exception as e:
         logger.error(f"❌ Error obtaining iSDAsoil API token: {str(e)}")
         return None
 
     
-def fetch_soil_data(lat: float, lon: float, retries: int = 3, delay: int = 2) -> dict:
+def request_soil_data(lat: float, lon: float, retries: int = 3, delay: int = 2,
+                      deadline: Optional[float] = None, refresh: bool = False) -> Dict[str, float]:
+    """
+    Fetch soil nutrients from iSDAsoil with retries, serving nearby points
+    from the grid-snapped soil cache first (unless refresh is set).
+    Raises after the last attempt, or earlier if the next retry would pass
+    the time.monotonic() deadline; see fetch_soil_data for the fallback variant.
+    Concurrent requests for the same coordinates (and refresh flag) share
+    one lookup; a caller waiting on another's lookup still honours its own
+    deadline, or the time its own retries could take, and raises TimeoutError.
+    """
+    if deadline is not None:
+        wait = deadline - time.monotonic()
+    else:
+        wait = retries * (sum(upstream_timeout('isda')) + delay)
+    return soil_flight.do(
+        (round(lat, 6), round(lon, 6), refresh), _request_soil_data, lat, lon, retries, delay, deadline, refresh,
+        timeout=wait
+    )
+
+
+def _request_soil_data(lat: float, lon: float, retries: int, delay: int,
+                       deadline: Optional[float], refresh: bool) -> Dict[str, float]:
+    if not refresh:
+        try:
+            cached = soil_cache.get(lat, lon)
+            if cached:
+                logger.info(f"Soil cache hit for lat={lat}, lon={lon}: {cached}")
+                return cached
+        except Exception as e:
+            logger.error(f"Soil cache lookup failed: {str(e)}")
+
     url = "https://api.isda-africa.com/isdasoil/v2/soilproperty"
     params = {
         "lon": lon,
@@ -160,19 +259,23 @@ def fetch_soil_data(lat: float, lon: float, retries: int = 3, delay: int = 2) ->
         # omit property filter, fetch all
     }
 
+    def call():
+        token = get_isda_client().get_token()
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "accept": "application/json"
+        }
+        response = get_session('isda').get(url, params=params, headers=headers, timeout=upstream_timeout('isda'))
+        if response.status_code == 401:
+            # Token revoked or expired early: drop it so the next attempt logs in again
+            get_isda_client().invalidate(token)
+        response.raise_for_status()
+        return response.json()
+
+    last_error = None
     for attempt in range(1, retries + 1):
         try:
-            token = get_isda_token()
-            if not token:
-                raise Exception("No token available")
-
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "accept": "application/json"
-            }
-            response = requests.get(url, params=params, headers=headers, timeout=15)
-            response.raise_for_status()
-            data = response.json()
+            data = breakers['isda'].call(call)
             props = data.get("property", {})
 
             # Safely extract values
@@ -183,21 +286,38 @@ def fetch_soil_data(lat: float, lon: float, retries: int = 3, delay: int = 2) ->
                     return default
 
             soil = {
-                "N": extract("nitrogen_total", 100.0),
-                "P": extract("phosphorous_extractable", 30.0),
-                "K": extract("potassium_extractable", 300.0),
-                "ph": extract("ph", 6.5)
+                "N": extract("nitrogen_total", SOIL_FALLBACK["N"]),
+                "P": extract("phosphorous_extractable", SOIL_FALLBACK["P"]),
+                "K": extract("potassium_extractable", SOIL_FALLBACK["K"]),
+                "ph": extract("ph", SOIL_FALLBACK["ph"])
             }
             logger.info(f"✅ Soil data fetched (attempt {attempt}): {soil}")
+            try:
+                soil_cache.put(lat, lon, soil)
+            except Exception as e:
+                logger.error(f"Soil cache store failed: {str(e)}")
             return soil
 
+        except CircuitOpenError:
+            # Fail fast: no retries or sleeps while iSDA is known to be down
+            raise
         except Exception as e:
+            last_error = e
             logger.error(f"⚠️ API error (attempt {attempt}/{retries}): {str(e)}")
             if attempt < retries:
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    break
                 time.sleep(delay)
 
-    logger.warning("⚠️ Failed after retries, using fallback soil data")
-    return {"N": 100.0, "P": 30.0, "K": 300.0, "ph": 6.5}
+    raise Exception(f"Soil data unavailable for lat={lat}, lon={lon}: {last_error}")
+
+
+def fetch_soil_data(lat: float, lon: float, retries: int = 3, delay: int = 2) -> dict:
+    try:
+        return request_soil_data(lat, lon, retries, delay)
+    except Exception:
+        logger.warning("⚠️ Failed after retries, using fallback soil data")
+        return dict(SOIL_FALLBACK)
 
 
 
@@ -257,13 +377,14 @@ def print_standardization_summary(original: Dict[str, float], standardized: Dict
     for key in original:
         logger.info(f"{key}: {original[key]} -> {standardized[key]}")
 
-def get_grok_crop_recommendation(soil_data, weather_data, crop=None, location_name=None):
+def request_grok_crop_recommendation(soil_data, weather_data, crop=None, location_name=None) -> str:
     """
-    Use Grok API to generate farmer-friendly crop insights.
+    Call the Grok API for farmer-friendly crop insights.
+    Raises on any failure so callers can tell real insights from errors.
     """
 
     if not GROK_API_KEY:
-        return "Grok API key not configured."
+        raise RuntimeError("Grok API key not configured.")
 
     url = "https://api.x.ai/v1/chat/completions"
 
@@ -309,13 +430,26 @@ Return:
         "max_tokens": 600
     }
 
-    try:
-        response = requests.post(url, headers=headers, json=payload, timeout=20)
-        data = response.json()
+    def call():
+        response = get_session('grok').post(url, headers=headers, json=payload, timeout=upstream_timeout('grok'))
+        response.raise_for_status()
+        return response.json()
+
+    data = breakers['grok'].call(call)
+
+    # Extract text
+    return data["choices"][0]["message"]["content"]
 
-        # Extract text
-        return data["choices"][0]["message"]["content"]
 
+def get_grok_crop_recommendation(soil_data, weather_data, crop=None, location_name=None):
+    """
+    Use Grok API to generate farmer-friendly crop insights.
+    """
+    if not GROK_API_KEY:
+        return "Grok API key not configured."
+
+    try:
+        return request_grok_crop_recommendation(soil_data, weather_data, crop, location_name)
     except Exception as e:
         return f"Error contacting Grok API: {str(e)}"
 
@@ -345,7 +479,7 @@ def test_grok_connection():
     }
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
+        response = get_session('grok').post(url, headers=headers, json=payload, timeout=(upstream_timeout('grok')[0], 10))
 
         if response.status_code != 200:
             return f"Error: {response.status_code}, {response.text}"
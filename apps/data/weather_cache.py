@@ -0,0 +1,93 @@
+import os
+import time
+import logging
+from typing import Any, Dict, Optional
+
+from apps.data.cache import TTLCache, MISSING
+from apps.data.geocode_cache import normalize_address
+
+logger = logging.getLogger(__name__)
+
+# Weather is reused until this many seconds after WeatherAPI's last_updated
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "3600"))
+# Minimum lifetime of a fresh entry, for forecasts that were already stale when fetched
+WEATHER_CACHE_MIN_TTL = int(os.getenv("WEATHER_CACHE_MIN_TTL", "300"))
+# How long a query keeps pointing at its resolved location (seconds)
+WEATHER_ALIAS_TTL = int(os.getenv("WEATHER_ALIAS_TTL", str(24 * 3600)))
+# Number of resolved locations kept per process
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "2048"))
+# Decimal places of the resolved coordinates that identify a location (~1 km)
+WEATHER_CACHE_PRECISION = int(os.getenv("WEATHER_CACHE_PRECISION", "2"))
+
+# query key -> resolved location key, so "Nakuru" and "Nakuru Town" share an entry
+_aliases = TTLCache(maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_ALIAS_TTL)
+# resolved location key -> cache entry
+_entries = TTLCache(maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_CACHE_TTL)
+
+
+def resolved_location_key(location: Dict[str, Any]) -> str:
+    """Key for the place WeatherAPI resolved a query to."""
+    return (f"{round(float(location['lat']), WEATHER_CACHE_PRECISION)},"
+            f"{round(float(location['lon']), WEATHER_CACHE_PRECISION)}")
+
+
+def coordinate_query(lat: float, lon: float) -> str:
+    """WeatherAPI query for a stored Location's coordinates."""
+    return f"{round(float(lat), 4)},{round(float(lon), 4)}"
+
+
+def entry_ttl(last_updated: Optional[float], now: float) -> float:
+    """Seconds until an observation taken at last_updated should be refetched."""
+    if not last_updated:
+        return WEATHER_CACHE_TTL
+    return min(WEATHER_CACHE_TTL, max(WEATHER_CACHE_MIN_TTL, last_updated + WEATHER_CACHE_TTL - now))
+
+
+def get_cached_weather(query: str) -> Optional[Dict[str, Any]]:
+    """Unexpired cache entry for a weather query, or None."""
+    location_key = _aliases.get(normalize_address(query))
+    if location_key is MISSING:
+        return None
+    entry = _entries.get(location_key)
+    return None if entry is MISSING else entry
+
+
+def store_weather(query: str, location_key: str, weather: Dict[str, float],
+                  last_updated: Optional[float]) -> Dict[str, Any]:
+    """Cache fresh weather for the resolved location and return the entry."""
+    now = time.time()
+    ttl = entry_ttl(last_updated, now)
+    entry = {
+        'weather': dict(weather),
+        'location_key': location_key,
+        'fetched_at': now,
+        'last_updated': last_updated,
+        'expires_at': now + ttl
+    }
+    _entries.set(location_key, entry, ttl=ttl)
+    _aliases.set(normalize_address(query), location_key)
+    return entry
+
+
+def weather_location_key(query: str) -> Optional[str]:
+    """Resolved location key a query currently points at, or None."""
+    location_key = _aliases.get(normalize_address(query))
+    return None if location_key is MISSING else location_key
+
+
+def link_weather_query(query: str, location_key: str) -> None:
+    """Point query at an already resolved location (e.g. a Location's coordinates at its name's entry)."""
+    _aliases.set(normalize_address(query), location_key)
+
+
+def share_weather(entry: Dict[str, Any], location_key: str) -> None:
+    """Also serve entry under location_key until it expires, for queries aliased there."""
+    ttl = entry['expires_at'] - time.time()
+    if ttl > 0:
+        _entries.set(location_key, dict(entry, location_key=location_key), ttl=ttl)
+
+
+def invalidate_weather(query: str) -> None:
+    location_key = _aliases.get(normalize_address(query))
+    if location_key is not MISSING:
+        _entries.pop(location_key)
@@ -0,0 +1,172 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import insert
+
+from apps import db
+
+logger = logging.getLogger(__name__)
+
+# Buffer telemetry inserts in-process; False writes each call synchronously
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "True") == "True"
+# Rows held in memory before producers are pushed back on
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+# Rows per flush transaction; a full batch is flushed without waiting for the interval
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+# Longest a buffered row waits before it is written (seconds)
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "1.0"))
+# How long a producer waits for queue space before writing its rows itself (seconds)
+WRITE_BEHIND_PUT_TIMEOUT = float(os.getenv("WRITE_BEHIND_PUT_TIMEOUT", "2.0"))
+
+# model -> callables run as hook(connection, rows) in the same transaction as the insert
+_flush_hooks: Dict[type, List[Callable]] = {}
+
+
+def register_flush_hook(model, hook: Callable) -> None:
+    """
+    Run hook(connection, rows) whenever rows of model are bulk-inserted.
+    Core bulk inserts skip ORM events, so anything maintained from an
+    after_insert listener must also register here.
+    """
+    _flush_hooks.setdefault(model, []).append(hook)
+
+
+def write_rows(model, rows: List[Dict]) -> None:
+    """Insert rows of one model in a single multi-row INSERT, plus its hooks, in one transaction."""
+    if not rows:
+        return
+    with db.engine.begin() as connection:
+        connection.execute(insert(model.__table__), rows)
+        for hook in _flush_hooks.get(model, []):
+            hook(connection, rows)
+
+
+class WriteBehindBuffer:
+    """
+    Bounded in-process buffer for append-only telemetry rows.
+
+    Request threads enqueue plain column dicts and return immediately; a
+    background thread groups them by model and writes each group with one
+    bulk INSERT whenever WRITE_BEHIND_BATCH_SIZE rows are waiting or
+    WRITE_BEHIND_INTERVAL has passed. When the queue is full a producer
+    waits up to WRITE_BEHIND_PUT_TIMEOUT in total and then writes its
+    remaining rows itself, so memory stays bounded and nothing is dropped
+    under load. Whatever is still buffered is flushed at interpreter exit.
+    """
+
+    def __init__(self, app, maxsize: int = WRITE_BEHIND_MAX_QUEUE, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 interval: float = WRITE_BEHIND_INTERVAL, put_timeout: float = WRITE_BEHIND_PUT_TIMEOUT):
+        self.app = app
+        self.batch_size = batch_size
+        self.interval = interval
+        self.put_timeout = put_timeout
+        self._queue: "queue.Queue[Tuple[type, Dict]]" = queue.Queue(maxsize=maxsize)
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def put(self, model, rows: Iterable[Dict]) -> None:
+        rows = list(rows)
+        # One deadline for the whole call, so a large batch waits at most put_timeout
+        deadline = time.monotonic() + self.put_timeout
+        overflow = []
+        for index, row in enumerate(rows):
+            try:
+                self._queue.put((model, row), timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                overflow = rows[index:]
+                break
+        if overflow:
+            logger.warning(f"Write-behind queue full, writing {len(overflow)} {model.__tablename__} rows inline")
+            with self.app.app_context():
+                write_rows(model, overflow)
+
+    def _drain(self, first: Optional[Tuple[type, Dict]] = None) -> Dict[type, List[Dict]]:
+        groups: Dict[type, List[Dict]] = {}
+        items = [first] if first else []
+        while len(items) < self.batch_size:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for model, row in items:
+            groups.setdefault(model, []).append(row)
+        return groups
+
+    def _write(self, groups: Dict[type, List[Dict]]) -> None:
+        with self.app.app_context():
+            for model, rows in groups.items():
+                try:
+                    write_rows(model, rows)
+                except Exception as e:
+                    logger.error(f"Bulk insert of {len(rows)} {model.__tablename__} rows failed, retrying singly: {str(e)}")
+                    for row in rows:
+                        try:
+                            write_rows(model, [row])
+                        except Exception as row_error:
+                            logger.error(f"Dropping {model.__tablename__} row {row}: {str(row_error)}")
+
+    def flush(self) -> None:
+        """Write everything currently buffered."""
+        with self._flush_lock:
+            while not self._queue.empty():
+                self._write(self._drain())
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.interval
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            # Let a batch accumulate until it is full or the interval runs out
+            while self._queue.qsize() + 1 < self.batch_size and time.monotonic() < deadline:
+                if self._stop.wait(min(0.05, max(0.0, deadline - time.monotonic()))):
+                    break
+            with self._flush_lock:
+                self._write(self._drain(first))
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
+        self.flush()
+
+
+_buffer: Optional[WriteBehindBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def _get_buffer() -> WriteBehindBuffer:
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = WriteBehindBuffer(current_app._get_current_object())
+                atexit.register(_buffer.stop)
+    return _buffer
+
+
+def enqueue(model, rows) -> None:
+    """
+    Queue one row (a dict of column values) or a list of rows for insertion.
+    Callers must set every value they care about, including timestamps,
+    since the row is written later.
+    """
+    rows = [rows] if isinstance(rows, dict) else list(rows)
+    if not WRITE_BEHIND_ENABLED:
+        write_rows(model, rows)
+        return
+    _get_buffer().put(model, rows)
+
+
+def flush() -> None:
+    """Write all buffered rows now (tests, CLI commands, shutdown hooks)."""
+    if _buffer is not None:
+        _buffer.flush()
@@ -6,9 +6,12 @@ from jinja2 import TemplateNotFound
 from apps.data.models import SoilData, WeatherData
 from apps.crop.models import Location
 from apps.model.models import Prediction
+from apps.analytics.util import crop_totals
+from apps.replica import reads_from_replica
 
 @blueprint.route('/index')
 @login_required
+@reads_from_replica
 def index():
     # Additional check: only admins can access dashboard
     print(f"DEBUG: Index route accessed")
@@ -24,14 +27,14 @@ def index():
         return redirect(url_for('data_blueprint.prediction'))
     
     print(f"DEBUG: User is admin, loading dashboard")
+    # Crop counts come from the incrementally maintained rollup, not the predictions table
+    crop_counts = crop_totals()
     total_locations = Location.query.count()
-    total_predictions = Prediction.query.count()
+    total_predictions = sum(crop_counts.values())
     total_soil_records = SoilData.query.count()
     total_weather_records = WeatherData.query.count()
     recent_predictions = Prediction.query.order_by(Prediction.timestamp.desc()).limit(5).all()
 
-    from collections import Counter
-    crop_counts = Counter([p.crop_recommended for p in Prediction.query.all()])
     labels = list(crop_counts.keys())
     data = list(crop_counts.values())
 
@@ -3,6 +3,14 @@ from datetime import datetime
 
 class Prediction(db.Model):
     __tablename__ = 'predictions'
+    __table_args__ = (
+        # get_user_predictions: WHERE user_id = ? ORDER BY timestamp DESC
+        db.Index('ix_predictions_user_id_timestamp', 'user_id', 'timestamp'),
+        # Keyset listing and "recent predictions": ORDER BY timestamp DESC, id DESC
+        db.Index('ix_predictions_timestamp_id', 'timestamp', 'id'),
+        # Analytics: GROUP BY location_id, crop_recommended
+        db.Index('ix_predictions_location_id_crop', 'location_id', 'crop_recommended'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False)
@@ -1,27 +1,69 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, jsonify
+from sqlalchemy.orm import joinedload
 from apps.crop.models import Location
 from apps.model.models import Prediction
+from apps.data.pagination import keyset_page, page_args, InvalidPageRequest
 from apps import db
 
 blueprint = Blueprint('model_blueprint', __name__, url_prefix='/model')
 
+
+def _prediction_page(args):
+    cursor, limit = page_args(args)
+    query = Prediction.query.options(joinedload(Prediction.location))
+    return keyset_page(query, Prediction.timestamp, Prediction.id, cursor, limit)
+
+
+def _serialize(p):
+    return {
+        'id': p.id,
+        'timestamp': p.timestamp.strftime('%Y-%m-%d %H:%M'),
+        'location': p.location.name if p.location else "Unknown",
+        'crop_recommended': p.crop_recommended,
+        'is_suitable': p.is_suitable,
+        'confidence_score': p.confidence_score
+    }
+
+
+def _chart_data():
+    """Chart series read from the prediction rollups, so their cost does not grow with the table."""
+    # Imported here: apps.analytics.util imports this package's models
+    from apps.analytics.util import CONFIDENCE_BIN_LABELS, crop_totals, outcome_counts
+
+    outcomes = outcome_counts()
+    crops = crop_totals()
+    return {
+        'suitability': outcomes['suitability'],
+        'confidence_labels': CONFIDENCE_BIN_LABELS,
+        'confidence_counts': outcomes['confidence'],
+        'crop_labels': list(crops.keys()),
+        'crop_counts': list(crops.values())
+    }
+
+
 @blueprint.route('/')
 def prediction():
-    predictions = Prediction.query.order_by(Prediction.timestamp.desc()).all()
-
-    serialized_predictions = []
-    for p in predictions:
-        serialized_predictions.append({
-            'timestamp': p.timestamp.strftime('%Y-%m-%d %H:%M'),
-            'location': p.location.name if p.location else "Unknown",
-            'crop_recommended': p.crop_recommended,
-            'is_suitable': p.is_suitable,
-            'confidence_score': p.confidence_score
-        })
+    try:
+        predictions, next_cursor = _prediction_page(request.args)
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
 
     return render_template(
         'predictions/view_predictions.html',
         predictions=predictions,
-        json_predictions=serialized_predictions
+        next_cursor=next_cursor,
+        chart_data=_chart_data()
     )
 
+
+@blueprint.route('/predictions', methods=['GET'])
+def predictions_api():
+    """Predictions as JSON, newest first, paged with ?cursor=<next_cursor>&limit=<n>"""
+    try:
+        predictions, next_cursor = _prediction_page(request.args)
+    except InvalidPageRequest as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'predictions': [_serialize(p) for p in predictions],
+        'next_cursor': next_cursor
+    }), 200
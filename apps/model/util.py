@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Feature keys accepted from API clients (lowercased)
+REQUIRED_FEATURES = ['n', 'p', 'k', 'ph', 'temperature', 'humidity', 'rainfall']
+
+# Column order used when the model does not expose feature_names_in_
+DEFAULT_MODEL_COLUMNS = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Model column name -> API feature key
+COLUMN_TO_FEATURE = {
+    'N': 'n',
+    'P': 'p',
+    'K': 'k',
+    'temperature': 'temperature',
+    'humidity': 'humidity',
+    'ph': 'ph',
+    'rainfall': 'rainfall',
+}
+
+TOP_K = 4
+
+
+def normalize_features(features: Dict) -> Dict[str, float]:
+    """
+    Lowercase feature keys and cast the required values to float.
+    Raises ValueError listing any missing features.
+    """
+    features = {k.lower(): v for k, v in features.items()}
+    missing = [k for k in REQUIRED_FEATURES if k not in features]
+    if missing:
+        raise ValueError(f'Missing required features: {missing}')
+    return {k: float(features[k]) for k in REQUIRED_FEATURES}
+
+
+def get_model_columns(model) -> List[str]:
+    try:
+        return list(model.feature_names_in_)
+    except Exception:
+        return DEFAULT_MODEL_COLUMNS
+
+
+def build_feature_matrix(model, feature_rows: List[Dict[str, float]]) -> np.ndarray:
+    """
+    Build an (n_rows, n_features) matrix in the column order the model was trained on.
+    """
+    input_df = pd.DataFrame([
+        {col: row[COLUMN_TO_FEATURE[col]] for col in COLUMN_TO_FEATURE}
+        for row in feature_rows
+    ])
+    return input_df[get_model_columns(model)].to_numpy()
+
+
+# HYBRID SMART-KENYA RULE ENGINE definition (JSON, hot-reloaded).
+# Each condition adds its boosts to the suitability score of the listed crops;
+# penalties scale the model probability of a crop everywhere.
+RULES_PATH = os.getenv(
+    'HYBRID_RULES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules', 'hybrid_rules.json')
+)
+# Minimum seconds between rule file mtime checks
+RULES_CHECK_INTERVAL = float(os.getenv('HYBRID_RULES_CHECK_INTERVAL', '2'))
+
+_COMPARATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+}
+
+
+def validate_rules(rules: Dict) -> Dict:
+    """
+    Check a ruleset definition, raising ValueError on the first problem found.
+    """
+    if not isinstance(rules, dict):
+        raise ValueError('Ruleset must be a JSON object')
+    for key in ('ml_weight', 'rule_weight'):
+        if not isinstance(rules.get(key), (int, float)):
+            raise ValueError(f'"{key}" must be a number')
+    if not isinstance(rules.get('base_suitability', 1.0), (int, float)):
+        raise ValueError('"base_suitability" must be a number')
+    penalties = rules.get('penalties', {})
+    if not isinstance(penalties, dict):
+        raise ValueError('"penalties" must map crop names to numbers')
+    for crop, factor in penalties.items():
+        if not isinstance(factor, (int, float)):
+            raise ValueError(f'Penalty for "{crop}" must be a number')
+    conditions = rules.get('conditions', [])
+    if not isinstance(conditions, list):
+        raise ValueError('"conditions" must be a list')
+    for idx, condition in enumerate(conditions):
+        if not isinstance(condition, dict):
+            raise ValueError(f'Condition {idx} must be a JSON object')
+        name = condition.get('name', idx)
+        if condition.get('feature') not in REQUIRED_FEATURES:
+            raise ValueError(f'Condition {name}: feature must be one of {REQUIRED_FEATURES}')
+        if condition.get('op') not in _COMPARATORS:
+            raise ValueError(f'Condition {name}: op must be one of {list(_COMPARATORS)}')
+        if not isinstance(condition.get('threshold'), (int, float)):
+            raise ValueError(f'Condition {name}: threshold must be a number')
+        boosts = condition.get('boosts')
+        if not isinstance(boosts, dict) or not all(isinstance(v, (int, float)) for v in boosts.values()):
+            raise ValueError(f'Condition {name}: boosts must map crop names to numbers')
+    return rules
+
+
+def load_rules(path: str = RULES_PATH) -> Dict:
+    with open(path, 'r') as f:
+        return validate_rules(json.load(f))
+
+
+def decode_classes(model, label_encoder) -> np.ndarray:
+    """Decode every model class to its crop name with a single encoder call."""
+    model_classes = np.asarray(model.classes_)
+    if np.issubdtype(model_classes.dtype, np.integer):
+        return np.asarray(label_encoder.inverse_transform(model_classes)).astype(str)
+    return model_classes.astype(str)
+
+
+class CompiledRules:
+    """
+    Hybrid rules compiled against a fixed class order.
+
+    Penalties become a per-class probability multiplier, conditions become a
+    (n_conditions, n_classes) boost matrix, so scoring a batch is a handful
+    of array operations over the probability matrix.
+    """
+
+    def __init__(self, rules: Dict, class_names):
+        self.class_names = np.asarray(class_names).astype(str)
+        lowered = [name.lower() for name in self.class_names]
+        class_index = {name: idx for idx, name in enumerate(lowered)}
+
+        self.ml_weight = float(rules['ml_weight'])
+        self.rule_weight = float(rules['rule_weight'])
+        self.base_suitability = float(rules.get('base_suitability', 1.0))
+
+        self.prob_multiplier = np.ones(len(lowered))
+        for crop, factor in rules.get('penalties', {}).items():
+            if crop.lower() in class_index:
+                self.prob_multiplier[class_index[crop.lower()]] *= float(factor)
+
+        conditions = rules.get('conditions', [])
+        self.condition_names = [c.get('name', f'rule_{idx}') for idx, c in enumerate(conditions)]
+        self.features = [c['feature'] for c in conditions]
+        self.comparators = [_COMPARATORS[c['op']] for c in conditions]
+        self.thresholds = np.array([float(c['threshold']) for c in conditions])
+        self.boosts = np.zeros((len(conditions), len(lowered)))
+        for cond_idx, condition in enumerate(conditions):
+            for crop, boost in condition['boosts'].items():
+                if crop.lower() in class_index:
+                    self.boosts[cond_idx, class_index[crop.lower()]] += float(boost)
+
+    def condition_mask(self, feature_rows: List[Dict[str, float]]) -> np.ndarray:
+        """(n_rows, n_conditions) matrix of 1.0 where a condition holds."""
+        mask = np.zeros((len(feature_rows), len(self.features)))
+        for cond_idx, (feature, compare) in enumerate(zip(self.features, self.comparators)):
+            values = np.array([row[feature] for row in feature_rows], dtype=float)
+            mask[:, cond_idx] = compare(values, self.thresholds[cond_idx])
+        return mask
+
+    def score(self, probability_matrix: np.ndarray, feature_rows: List[Dict[str, float]]) -> np.ndarray:
+        """HYBRID SCORE for every (row, class): ML weight * probability + rule weight * suitability."""
+        suitability = self.base_suitability + self.condition_mask(feature_rows) @ self.boosts
+        return (self.ml_weight * probability_matrix * self.prob_multiplier) + (self.rule_weight * suitability)
+
+    def index(self) -> Dict[str, Dict[str, float]]:
+        """Compiled boosts keyed by crop, then by condition name."""
+        return {
+            str(crop): {
+                self.condition_names[cond_idx]: float(self.boosts[cond_idx, class_idx])
+                for cond_idx in np.flatnonzero(self.boosts[:, class_idx])
+            }
+            for class_idx, crop in enumerate(self.class_names)
+            if self.boosts[:, class_idx].any()
+        }
+
+
+class HybridRuleEngine:
+    """
+    Holds the compiled ruleset and recompiles it when the rule file changes.
+
+    The file's mtime is checked at most every check_interval seconds; a new
+    CompiledRules is built aside and swapped in with a single assignment, so
+    in-flight requests keep scoring against the ruleset they started with.
+    An invalid file is logged and the previous ruleset stays active.
+    """
+
+    def __init__(self, class_names, path: str = RULES_PATH, check_interval: float = RULES_CHECK_INTERVAL):
+        self.class_names = np.asarray(class_names).astype(str)
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._last_check = 0.0
+        self.rules: Dict = {}
+        self.compiled: Optional[CompiledRules] = None
+        self.reload(force=True)
+
+    def reload(self, force: bool = False) -> bool:
+        """Recompile the rule file if it changed (or always, when forced). Returns True if swapped."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            mtime = None
+            try:
+                mtime = os.path.getmtime(self.path)
+                if not force and mtime == self._mtime:
+                    return False
+                rules = load_rules(self.path)
+                compiled = CompiledRules(rules, self.class_names)
+            except Exception as e:
+                if self.compiled is None:
+                    raise
+                # Remember the broken file's mtime so it is reported once, not on every check
+                self._mtime = mtime if mtime is not None else self._mtime
+                logger.error(f"Keeping previous hybrid ruleset, failed to load {self.path}: {str(e)}")
+                return False
+            self.rules, self.compiled, self._mtime = rules, compiled, mtime
+            logger.info(f"Hybrid ruleset loaded from {self.path} ({len(compiled.condition_names)} conditions)")
+            return True
+
+    def current(self) -> CompiledRules:
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self.reload()
+        return self.compiled
+
+    def candidate(self, rules: Dict) -> CompiledRules:
+        """Compile an unsaved ruleset against the same class order, without activating it."""
+        return CompiledRules(validate_rules(rules), self.class_names)
+
+
+def top_predictions(scores: np.ndarray, class_names: np.ndarray, k: int = TOP_K) -> List[Dict[str, float]]:
+    order = np.argsort(-scores, kind='stable')[:k]
+    return [
+        {"crop": str(class_names[idx]), "probability": float(scores[idx])}
+        for idx in order
+    ]
+
+
+def score_batch(model, compiled_rules: CompiledRules, feature_rows: List[Dict[str, float]]) -> List[Dict]:
+    """
+    Score many feature rows with a single predict_proba call.
+
+    The ML label is taken from the argmax of the probability matrix instead
+    of a second model.predict pass over the forest.
+    """
+    feature_matrix = build_feature_matrix(model, feature_rows)
+    probability_matrix = model.predict_proba(feature_matrix)
+    return score_probabilities(probability_matrix, compiled_rules, feature_rows)
+
+
+def score_probabilities(probability_matrix: np.ndarray, compiled_rules: CompiledRules,
+                        feature_rows: List[Dict[str, float]]) -> List[Dict]:
+    hybrid_matrix = compiled_rules.score(probability_matrix, feature_rows)
+    ml_indices = np.argmax(probability_matrix, axis=1)
+
+    return [
+        {
+            'ml_prediction': str(compiled_rules.class_names[ml_indices[row_idx]]),
+            'predictions': top_predictions(hybrid_matrix[row_idx], compiled_rules.class_names),
+        }
+        for row_idx in range(len(feature_rows))
+    ]
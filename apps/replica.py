@@ -0,0 +1,45 @@
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask_sqlalchemy.session import Session
+
+# SQLALCHEMY_BINDS key of the read replica (see apps.config)
+REPLICA_BIND = 'replica'
+
+_use_replica: ContextVar[bool] = ContextVar('use_replica', default=False)
+
+
+class RoutingSession(Session):
+    """
+    db.session that sends SELECTs to the replica bind inside use_replica().
+
+    Everything else (writes, flushes, code outside use_replica, and all
+    queries when no replica is configured) stays on the primary, so
+    existing queries need no changes to be routed.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and _use_replica.get() and not self._flushing
+                and getattr(clause, 'is_select', False) and REPLICA_BIND in self._db.engines):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def use_replica():
+    """Route reads in this block to the replica; results may lag the primary slightly."""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def reads_from_replica(view):
+    """Run a read-only view's queries against the replica."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Check that the hot Smart Farma queries are served by an index.
+
+Runs EXPLAIN (MySQL, PostgreSQL) or EXPLAIN QUERY PLAN (SQLite) for each
+query and reports the index the planner picked. Exits non-zero if any
+query is not using its expected index.
+
+Usage:
+    python check_query_plans.py [--database-uri URI]
+
+Run it against a database with realistic row counts: on nearly empty
+tables planners may prefer a full scan even when the index exists.
+"""
+import os
+import sys
+import argparse
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from sqlalchemy import func, select, text
+
+from apps import create_app, db
+from apps.config import config_dict
+from apps.data.models import SoilData, WeatherData
+from apps.model.models import Prediction
+
+
+def hot_queries():
+    """(description, expected index, statement) for each hot access path."""
+    return [
+        ("User prediction history",
+         'ix_predictions_user_id_timestamp',
+         select(Prediction).where(Prediction.user_id == 1)
+         .order_by(Prediction.timestamp.desc()).limit(50)),
+        ("Prediction listing page",
+         'ix_predictions_timestamp_id',
+         select(Prediction).order_by(Prediction.timestamp.desc(), Prediction.id.desc()).limit(51)),
+        ("Crop counts per location",
+         'ix_predictions_location_id_crop',
+         select(Prediction.location_id, Prediction.crop_recommended, func.count(Prediction.id))
+         .group_by(Prediction.location_id, Prediction.crop_recommended)),
+        ("Latest soil reading for a location",
+         'ix_soil_data_location_id_date',
+         select(SoilData).where(SoilData.location_id == 1)
+         .order_by(SoilData.date_recorded.desc()).limit(1)),
+        ("Soil listing page",
+         'ix_soil_data_date_id',
+         select(SoilData).order_by(SoilData.date_recorded.desc(), SoilData.id.desc()).limit(51)),
+        ("Latest weather reading for a location",
+         'ix_weather_data_location_id_date',
+         select(WeatherData).where(WeatherData.location_id == 1)
+         .order_by(WeatherData.date_recorded.desc()).limit(1)),
+        ("Weather listing page",
+         'ix_weather_data_date_id',
+         select(WeatherData).order_by(WeatherData.date_recorded.desc(), WeatherData.id.desc()).limit(51)),
+    ]
+
+
+def explain(connection, statement):
+    """Return (plan text, indexes used) for a statement on the current dialect."""
+    dialect = connection.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+    if dialect.name == 'sqlite':
+        rows = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        plan = "\n".join(row[-1] for row in rows)
+        used = {word for row in rows for word in row[-1].split() if word.startswith('ix_')}
+        return plan, used
+
+    if dialect.name == 'mysql':
+        rows = connection.execute(text(f"EXPLAIN {sql}")).mappings().fetchall()
+        plan = "\n".join(f"table={row['table']} type={row['type']} key={row['key']} extra={row['Extra']}" for row in rows)
+        used = {row['key'] for row in rows if row['key']}
+        return plan, used
+
+    rows = connection.execute(text(f"EXPLAIN {sql}")).fetchall()
+    plan = "\n".join(row[0] for row in rows)
+    used = {word for row in rows for word in row[0].split() if word.startswith('ix_')}
+    return plan, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-uri', help='Database to check instead of the configured one')
+    args = parser.parse_args()
+
+    config = config_dict['Debug' if os.getenv('DEBUG', 'False') == 'True' else 'Production']
+    if args.database_uri:
+        config = type('CheckConfig', (config,), {'SQLALCHEMY_DATABASE_URI': args.database_uri})
+    app = create_app(config)
+
+    failures = 0
+    with app.app_context(), db.engine.connect() as connection:
+        print(f"Checking query plans on {connection.dialect.name}\n")
+        for description, expected, statement in hot_queries():
+            plan, used = explain(connection, statement)
+            ok = expected in used
+            failures += not ok
+            print(f"[{'OK' if ok else 'MISSING'}] {description} (expects {expected})")
+            for line in plan.splitlines():
+                print(f"    {line}")
+            print()
+
+    if failures:
+        print(f"{failures} hot queries are not using their index")
+        sys.exit(1)
+    print("All hot queries use their indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 bind = '0.0.0.0:5005'
 workers = 1
+# Threads keep the worker responsive while insight polls / SSE streams are open;
+# with a sync worker class the stream endpoint answers once instead of holding the worker
+threads = 4
 accesslog = '-'
 loglevel = 'debug'
 capture_output = True
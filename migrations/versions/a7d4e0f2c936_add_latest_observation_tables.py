@@ -0,0 +1,62 @@
+"""Add latest soil and weather observation tables
+
+Revision ID: a7d4e0f2c936
+Revises: f6c3d9e1b825
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d4e0f2c936'
+down_revision = 'f6c3d9e1b825'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'latest_soil',
+        sa.Column('location_id', sa.Integer(), nullable=False),
+        sa.Column('nitrogen', sa.Float(), nullable=False),
+        sa.Column('phosphorus', sa.Float(), nullable=False),
+        sa.Column('potassium', sa.Float(), nullable=False),
+        sa.Column('ph', sa.Float(), nullable=False),
+        sa.Column('date_recorded', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['location_id'], ['locations.id']),
+        sa.PrimaryKeyConstraint('location_id')
+    )
+    op.create_table(
+        'latest_weather',
+        sa.Column('location_id', sa.Integer(), nullable=False),
+        sa.Column('temperature', sa.Float(), nullable=False),
+        sa.Column('humidity', sa.Float(), nullable=False),
+        sa.Column('rainfall', sa.Float(), nullable=False),
+        sa.Column('date_recorded', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['location_id'], ['locations.id']),
+        sa.PrimaryKeyConstraint('location_id')
+    )
+
+    # Seed from the newest history row per location (ties go to the highest id);
+    # inserts keep the tables current from here on
+    op.execute(
+        "INSERT INTO latest_soil (location_id, nitrogen, phosphorus, potassium, ph, date_recorded) "
+        "SELECT s.location_id, s.nitrogen, s.phosphorus, s.potassium, s.ph, COALESCE(s.date_recorded, CURRENT_TIMESTAMP) "
+        "FROM soil_data s WHERE s.id = ("
+        "SELECT n.id FROM soil_data n WHERE n.location_id = s.location_id "
+        "ORDER BY n.date_recorded DESC, n.id DESC LIMIT 1)"
+    )
+    op.execute(
+        "INSERT INTO latest_weather (location_id, temperature, humidity, rainfall, date_recorded) "
+        "SELECT w.location_id, w.temperature, w.humidity, w.rainfall, COALESCE(w.date_recorded, CURRENT_TIMESTAMP) "
+        "FROM weather_data w WHERE w.id = ("
+        "SELECT n.id FROM weather_data n WHERE n.location_id = w.location_id "
+        "ORDER BY n.date_recorded DESC, n.id DESC LIMIT 1)"
+    )
+
+
+def downgrade():
+    op.drop_table('latest_weather')
+    op.drop_table('latest_soil')
@@ -0,0 +1,38 @@
+"""Add insight_cache table
+
+Revision ID: b7d1e4a9c210
+Revises: abc123def456
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d1e4a9c210'
+down_revision = 'abc123def456'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'insight_cache',
+        sa.Column('cache_key', sa.String(length=64), nullable=False),
+        sa.Column('crop', sa.String(length=100), nullable=False),
+        sa.Column('location_name', sa.String(length=255), nullable=True),
+        sa.Column('insights', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('last_accessed', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('cache_key')
+    )
+    with op.batch_alter_table('insight_cache', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_insight_cache_last_accessed'), ['last_accessed'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('insight_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_insight_cache_last_accessed'))
+
+    op.drop_table('insight_cache')
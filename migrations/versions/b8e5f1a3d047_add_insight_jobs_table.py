@@ -0,0 +1,38 @@
+"""Add insight jobs table
+
+Revision ID: b8e5f1a3d047
+Revises: a7d4e0f2c936
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e5f1a3d047'
+down_revision = 'a7d4e0f2c936'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'insight_jobs',
+        sa.Column('job_id', sa.String(length=32), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('crop', sa.String(length=100), nullable=False),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('job_id')
+    )
+    with op.batch_alter_table('insight_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_insight_jobs_created_at'), ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('insight_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_insight_jobs_created_at'))
+
+    op.drop_table('insight_jobs')
@@ -0,0 +1,34 @@
+"""Add geocode_cache table
+
+Revision ID: c3f8a2d5e671
+Revises: b7d1e4a9c210
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a2d5e671'
+down_revision = 'b7d1e4a9c210'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'geocode_cache',
+        sa.Column('query_key', sa.String(length=255), nullable=False),
+        sa.Column('address', sa.String(length=255), nullable=False),
+        sa.Column('found', sa.Boolean(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=True),
+        sa.Column('longitude', sa.Float(), nullable=True),
+        sa.Column('display_name', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('query_key')
+    )
+
+
+def downgrade():
+    op.drop_table('geocode_cache')
@@ -0,0 +1,43 @@
+"""Add prediction outcome rollup table
+
+Revision ID: c9f6a2b4e158
+Revises: b8e5f1a3d047
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9f6a2b4e158'
+down_revision = 'b8e5f1a3d047'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'rollup_prediction_outcome',
+        sa.Column('is_suitable', sa.Boolean(), nullable=False),
+        sa.Column('confidence_bucket', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('is_suitable', 'confidence_bucket')
+    )
+
+    # Seed from existing predictions with the buckets of apps.analytics.util.CONFIDENCE_BINS
+    op.execute(
+        "INSERT INTO rollup_prediction_outcome (is_suitable, confidence_bucket, count) "
+        "SELECT is_suitable, bucket, COUNT(*) FROM ("
+        "SELECT is_suitable, CASE "
+        "WHEN confidence_score <= 0.2 THEN 0 "
+        "WHEN confidence_score <= 0.4 THEN 1 "
+        "WHEN confidence_score <= 0.6 THEN 2 "
+        "WHEN confidence_score <= 0.8 THEN 3 "
+        "ELSE 4 END AS bucket FROM predictions) AS scored "
+        "GROUP BY is_suitable, bucket"
+    )
+
+
+def downgrade():
+    op.drop_table('rollup_prediction_outcome')
@@ -0,0 +1,71 @@
+"""Add geohash to locations
+
+Revision ID: d4a9b6e2f713
+Revises: c3f8a2d5e671
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a9b6e2f713'
+down_revision = 'c3f8a2d5e671'
+branch_labels = None
+depends_on = None
+
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lon, precision=9):
+    # Frozen copy of apps.crop.util.geohash_encode as of this revision
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        ch <<= 1
+        if value >= mid:
+            ch |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return ''.join(chars)
+
+
+def upgrade():
+    with op.batch_alter_table('locations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geohash', sa.String(length=12), nullable=True))
+        batch_op.create_index(batch_op.f('ix_locations_geohash'), ['geohash'], unique=False)
+
+    # Backfill existing rows; `flask dedupe-locations` then merges near-duplicates
+    connection = op.get_bind()
+    locations = sa.table(
+        'locations',
+        sa.column('id', sa.Integer),
+        sa.column('latitude', sa.Float),
+        sa.column('longitude', sa.Float),
+        sa.column('geohash', sa.String)
+    )
+    rows = connection.execute(
+        sa.select(locations.c.id, locations.c.latitude, locations.c.longitude)
+        .where(locations.c.latitude.isnot(None), locations.c.longitude.isnot(None))
+    ).fetchall()
+    for row in rows:
+        connection.execute(
+            locations.update().where(locations.c.id == row.id)
+            .values(geohash=geohash_encode(row.latitude, row.longitude))
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('locations', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_locations_geohash'))
+        batch_op.drop_column('geohash')
@@ -0,0 +1,64 @@
+"""Add prediction rollup tables
+
+Revision ID: e5b2c7d8a914
+Revises: d4a9b6e2f713
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b2c7d8a914'
+down_revision = 'd4a9b6e2f713'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'rollup_location_crop',
+        sa.Column('location_id', sa.Integer(), nullable=False),
+        sa.Column('crop', sa.String(length=100), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['location_id'], ['locations.id']),
+        sa.PrimaryKeyConstraint('location_id', 'crop')
+    )
+    op.create_table(
+        'rollup_daily_crop',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('crop', sa.String(length=100), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'crop')
+    )
+    op.create_table(
+        'rollup_user_crop',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('crop', sa.String(length=100), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id', 'crop')
+    )
+
+    # Seed the rollups from existing predictions; inserts keep them current from here on
+    op.execute(
+        "INSERT INTO rollup_location_crop (location_id, crop, count) "
+        "SELECT location_id, crop_recommended, COUNT(id) FROM predictions "
+        "GROUP BY location_id, crop_recommended"
+    )
+    op.execute(
+        "INSERT INTO rollup_daily_crop (day, crop, count) "
+        "SELECT DATE(timestamp), crop_recommended, COUNT(id) FROM predictions "
+        "WHERE timestamp IS NOT NULL GROUP BY DATE(timestamp), crop_recommended"
+    )
+    op.execute(
+        "INSERT INTO rollup_user_crop (user_id, crop, count) "
+        "SELECT COALESCE(user_id, 0), crop_recommended, COUNT(id) FROM predictions "
+        "GROUP BY COALESCE(user_id, 0), crop_recommended"
+    )
+
+
+def downgrade():
+    op.drop_table('rollup_user_crop')
+    op.drop_table('rollup_daily_crop')
+    op.drop_table('rollup_location_crop')
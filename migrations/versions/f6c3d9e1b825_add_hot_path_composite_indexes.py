@@ -0,0 +1,42 @@
+"""Add composite indexes for hot prediction, soil and weather queries
+
+Revision ID: f6c3d9e1b825
+Revises: e5b2c7d8a914
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c3d9e1b825'
+down_revision = 'e5b2c7d8a914'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    ('ix_predictions_user_id_timestamp', 'predictions', ['user_id', 'timestamp']),
+    ('ix_predictions_timestamp_id', 'predictions', ['timestamp', 'id']),
+    ('ix_predictions_location_id_crop', 'predictions', ['location_id', 'crop_recommended']),
+    ('ix_soil_data_location_id_date', 'soil_data', ['location_id', 'date_recorded']),
+    ('ix_soil_data_date_id', 'soil_data', ['date_recorded', 'id']),
+    ('ix_weather_data_location_id_date', 'weather_data', ['location_id', 'date_recorded']),
+    ('ix_weather_data_date_id', 'weather_data', ['date_recorded', 'id']),
+)
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    # MySQL keeps using an index that leads with a foreign key column for the
+    # constraint, so each FK needs its own index before the composite is dropped.
+    # Other databases never had these indexes.
+    is_mysql = op.get_bind().dialect.name == 'mysql'
+    for name, table, columns in reversed(INDEXES):
+        if is_mysql and columns[0].endswith('_id') and columns[0] != 'id':
+            op.create_index(f'ix_{table}_{columns[0]}', table, [columns[0]], unique=False)
+        op.drop_index(name, table_name=table)